@@ -0,0 +1,97 @@
+"""
+Latency benchmark for downscaling input images before upload.
+
+Builds synthetic phone-camera photos (12 MP JPEG, and a PNG screenshot-like
+image), runs each through ``utils.image_prep.downscale`` at the Gemini
+tools' ``IMAGE_MAX_EDGE`` and reports:
+
+- the preprocessing time (median of several runs)
+- the inline payload before and after (base64, as it goes on the wire)
+- the upload time saved at a few uplink speeds, net of preprocessing,
+  both in total and per MB of original image
+
+Upload time is modelled as payload bits over the uplink speed, which
+leaves out the model's own time spent decoding the larger image. Requires
+Pillow. Run from the repository root:
+
+    python scripts/bench_image_downscale.py
+"""
+
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+MAX_EDGE = 3072
+UPLINKS_MBIT = [10, 50, 100]
+RUNS = 5
+
+
+def _photo(width: int, height: int, fmt: str) -> bytes:
+    from PIL import Image
+
+    # Noise over gradients compresses roughly like a real photo
+    noise = Image.effect_noise((width, height), 24)
+    red = Image.linear_gradient("L").resize((width, height))
+    blue = Image.radial_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (Image.blend(red, noise, 0.35), noise, Image.blend(blue, noise, 0.35)))
+    output = io.BytesIO()
+    if fmt == "JPEG":
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated, as phones often write it
+        exif[0x010F] = "Benchmark"
+        image.save(output, fmt, quality=92, exif=exif)
+    else:
+        image.save(output, fmt)
+    return output.getvalue()
+
+
+def _encoded(size: int) -> int:
+    return 4 * -(-size // 3)
+
+
+def _measure(source: bytes) -> tuple[float, int]:
+    from utils import image_prep
+    from utils.deadline import Deadline
+
+    timings = []
+    size = len(source)
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        output: Any = image_prep.downscale(io.BytesIO(source), MAX_EDGE, Deadline(60))
+        timings.append(time.perf_counter() - started)
+        if output is not None:
+            size = len(output.read())
+            output.close()
+    return statistics.median(timings), size
+
+
+def main() -> None:
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("Pillow is not installed; pip install Pillow to run this benchmark")
+        return
+
+    cases = [
+        ("12 MP JPEG", _photo(4032, 3024, "JPEG")),
+        ("12 MP PNG", _photo(4032, 3024, "PNG")),
+        ("48 MP JPEG", _photo(8064, 6048, "JPEG")),
+    ]
+    for name, source in cases:
+        seconds, size = _measure(source)
+        before, after = _encoded(len(source)), _encoded(size)
+        megabytes = len(source) / (1024 * 1024)
+        print(f"{name}: {megabytes:.1f} MB -> {size / (1024 * 1024):.2f} MB, preprocessing {seconds * 1000:.0f} ms")
+        print(f"  inline payload {before / (1024 * 1024):.1f} MB -> {after / (1024 * 1024):.2f} MB")
+        for uplink in UPLINKS_MBIT:
+            saved = (before - after) * 8 / (uplink * 1_000_000) - seconds
+            print(f"  {uplink:>4} Mbit/s: {saved * 1000:>7.0f} ms saved, {saved * 1000 / megabytes:>6.0f} ms per MB")
+
+
+if __name__ == "__main__":
+    main()
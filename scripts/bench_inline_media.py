@@ -0,0 +1,126 @@
+"""
+Peak-RSS benchmark for inline media in the Gemini text tools.
+
+Serves a random image of each size from a local server and sends a Gemini
+style request with it inline to a local sink, once the way the tools used
+to (``response.content`` -> ``b64encode`` -> ``str`` -> ``json=``) and
+once through ``utils.inline_media`` (base64 encoded while downloading into
+a spool, request body streamed). Each run happens in a fresh subprocess;
+the reported figure is how far its peak RSS rose above the peak after
+imports.
+
+Run from the repository root:
+
+    python scripts/bench_inline_media.py
+"""
+
+import base64
+import os
+import resource
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SIZES_MB = [5, 10, 20]
+MODES = ["buffered", "streamed"]
+_BLOCK = os.urandom(1024 * 1024)
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        size = int(self.path.rsplit("/", 1)[-1])
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        while size:
+            block = _BLOCK[: min(size, len(_BLOCK))]
+            self.wfile.write(block)
+            size -= len(block)
+
+    def do_POST(self) -> None:
+        # Read and discard the body in blocks
+        left = int(self.headers.get("Content-Length", "0"))
+        while left:
+            left -= len(self.rfile.read(min(left, 1024 * 1024)))
+        payload = b'{"candidates": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def _request(data: Any) -> dict[str, Any]:
+    return {
+        "contents": [
+            {
+                "role": "user",
+                "parts": [{"text": "Describe this image"}, {"inlineData": {"mimeType": "image/png", "data": data}}],
+            }
+        ],
+        "generationConfig": {"temperature": 0.7, "maxOutputTokens": 1024},
+    }
+
+
+def child(mode: str, base: str, size: int) -> None:
+    from utils import http_pool, inline_media
+    from utils.deadline import Deadline
+
+    headers = {"Content-Type": "application/json"}
+    before = _peak_rss_kb()
+    if mode == "buffered":
+        response = http_pool.get(f"{base}/image/{size}", timeout=30)
+        encoded = base64.b64encode(response.content).decode("utf-8")
+        http_pool.post(f"{base}/generate", headers=headers, json=_request(encoded), timeout=30)
+    else:
+        media = inline_media.fetch(f"{base}/image/{size}", Deadline(30))
+        http_pool.post(f"{base}/generate", headers=headers, timeout=30, **inline_media.body_kwargs(_request(media)))
+    print(_peak_rss_kb() - before)
+
+
+def main() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    header = f"{'image':>8} " + " ".join(f"{mode + ' peak':>16}" for mode in MODES) + f" {'reduction':>10}"
+    print(header)
+    print("-" * len(header))
+    for size_mb in SIZES_MB:
+        size = size_mb * 1024 * 1024
+        peaks = []
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", mode, base, str(size)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            peaks.append(int(output.split()[-1]) / 1024)
+        cells = " ".join(f"{peak:>13.1f} MB" for peak in peaks)
+        print(f"{size_mb:>5} MB {cells} {peaks[0] / max(peaks[1], 0.1):>9.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,62 @@
+"""
+Compare poll schedules by simulation.
+
+For a range of completion times, count the polls each schedule issues and
+how long after completion the job is noticed. Run from the repository root:
+
+    python scripts/bench_poll_schedule.py
+"""
+
+import random
+import statistics
+import sys
+from dataclasses import asdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import poll_schedule  # noqa: E402
+from utils.poll_schedule import PollSchedule, PriorPollSchedule  # noqa: E402
+
+TRIALS = 2000
+
+
+def simulate(schedule: PollSchedule, completes_at: float, rng: random.Random) -> tuple[int, float]:
+    """
+    Return (polls issued, seconds between completion and the poll that saw it).
+    """
+    now = 0.0
+    polls = 0
+    intervals = schedule.intervals(rng)
+    while True:
+        now += next(intervals)
+        polls += 1
+        if now >= completes_at:
+            return polls, now - completes_at
+
+
+def main() -> None:
+    rng = random.Random(0)
+    cases = [
+        ("FAST_IMAGE", poll_schedule.FAST_IMAGE, (3, 8, 20)),
+        ("IMAGE", poll_schedule.IMAGE, (10, 30, 60)),
+        ("VIDEO", poll_schedule.VIDEO, (60, 180, 300, 600)),
+        # Video bucket whose observed p50/p90 are 180s/240s
+        ("VIDEO+prior", PriorPollSchedule(**asdict(poll_schedule.VIDEO), p50=180, p90=240), (150, 180, 220, 300)),
+    ]
+    print(f"{'schedule':<11} {'done at':>8} {'flat polls':>11} {'polls':>7} {'saved':>7} {'added latency p50/max':>22}")
+    for name, schedule, durations in cases:
+        for completes_at in durations:
+            flat_polls, _ = simulate(poll_schedule.FLAT, completes_at, rng)
+            results = [simulate(schedule, completes_at, rng) for _ in range(TRIALS)]
+            polls = statistics.mean(r[0] for r in results)
+            latencies = [r[1] for r in results]
+            saved = 1 - polls / flat_polls
+            print(
+                f"{name:<11} {completes_at:>7}s {flat_polls:>11} {polls:>7.1f} {saved:>6.0%} "
+                f"{statistics.median(latencies):>10.1f}s / {max(latencies):.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
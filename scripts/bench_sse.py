@@ -0,0 +1,314 @@
+"""
+Micro-benchmark for the SSE parser in ``utils.sse``.
+
+Builds a synthetic stream for each wire format the text tools read, splits
+it into network-sized chunks and measures, for the incremental byte parser
+and for the line-based reader it replaced (``iter_lines`` with decoded
+lines joined per event):
+
+- events/sec parsing only, and with JSON decoded the way the tool consumes
+  events (the line reader decodes every event, the byte parser only the
+  event types the tool asks for)
+- transient bytes allocated per event: the tracemalloc peak growth while
+  each chunk is parsed, summed over all chunks and divided by the number of
+  events in the stream
+
+``--check`` instead feeds randomized streams (CRLF and LF line endings,
+comments, id/retry fields, multi-line and empty data, UTF-8 text, with and
+without a final blank line), split into random chunks that also cut
+through CRLF pairs and multi-byte characters, to ``SSEParser`` and
+compares its events with a straightforward reference reader.
+
+Run from the repository root:
+
+    python scripts/bench_sse.py
+    python scripts/bench_sse.py --check
+"""
+
+import codecs
+import json
+import random
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import sse, text_stream  # noqa: E402
+
+EVENTS = 20000
+ROUNDS = 7
+CHECK_STREAMS = 5000
+
+
+def _event(name: str | None, payload: dict[str, Any]) -> bytes:
+    head = f"event: {name}\n" if name else ""
+    return f"{head}data: {json.dumps(payload)}\n\n".encode()
+
+
+def _words(rng: random.Random) -> str:
+    return "".join(rng.choice(["the ", "stream", "ing ", "tok", "en ", "s, ", "and ", "more. "]) for _ in range(2))
+
+
+def anthropic_stream(rng: random.Random, count: int) -> bytes:
+    parts = [_event("message_start", {"type": "message_start", "message": {"usage": {"input_tokens": 12}}})]
+    parts.append(_event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}))
+    for i in range(count):
+        if i % 10 == 0:
+            parts.append(_event("ping", {"type": "ping"}))
+        delta = {"type": "text_delta", "text": _words(rng)}
+        parts.append(_event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": delta}))
+    parts.append(_event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": count}}))
+    parts.append(_event("message_stop", {"type": "message_stop"}))
+    return b"".join(parts)
+
+
+def chat_stream(rng: random.Random, count: int) -> bytes:
+    parts = []
+    for i in range(count):
+        choice = {"index": 0, "delta": {"content": _words(rng)}, "finish_reason": None}
+        parts.append(_event(None, {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": i, "choices": [choice]}))
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def responses_stream(rng: random.Random, count: int) -> bytes:
+    parts = []
+    for i in range(count):
+        if i % 4 == 0:
+            # Reasoning summaries interleave with the answer on reasoning models
+            name = "response.reasoning_summary_text.delta"
+            parts.append(_event(name, {"type": name, "item_id": "rs_1", "delta": _words(rng), "sequence_number": i}))
+        name = "response.output_text.delta"
+        payload = {"type": name, "item_id": "msg_1", "output_index": 1, "content_index": 0, "delta": _words(rng), "sequence_number": i}
+        parts.append(_event(name, payload))
+    name = "response.completed"
+    parts.append(_event(name, {"type": name, "response": {"status": "completed", "usage": {"output_tokens": count}}}))
+    return b"".join(parts)
+
+
+def gemini_stream(rng: random.Random, count: int) -> bytes:
+    parts = []
+    for i in range(count):
+        candidate = {"content": {"role": "model", "parts": [{"text": _words(rng) * 4}]}, "index": 0}
+        usage = {"promptTokenCount": 12, "candidatesTokenCount": i, "totalTokenCount": 12 + i}
+        parts.append(_event(None, {"candidates": [candidate], "usageMetadata": usage, "modelVersion": "gemini-2.5-flash-lite"}))
+    return b"".join(parts)
+
+
+FORMATS: list[tuple[str, Callable[[random.Random, int], bytes], frozenset[str] | None]] = [
+    ("anthropic messages", anthropic_stream, text_stream.ANTHROPIC_EVENTS),
+    ("openai chat", chat_stream, None),
+    ("openai responses", responses_stream, text_stream.OPENAI_RESPONSES_EVENTS),
+    ("gemini sse", gemini_stream, None),
+]
+
+
+def split(stream: bytes, rng: random.Random) -> list[bytes]:
+    chunks = []
+    pos = 0
+    while pos < len(stream):
+        size = rng.randint(256, 4096)
+        chunks.append(stream[pos : pos + size])
+        pos += size
+    return chunks
+
+
+class LineReader:
+    """
+    The previous line-based reader, fed chunk by chunk.
+
+    Mirrors ``Response.iter_lines(decode_unicode=True)``: chunks are decoded,
+    prepended with the pending partial line and split into lines; data lines
+    are collected and joined per event.
+    """
+
+    def __init__(self) -> None:
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending: str | None = None
+        self._event: str | None = None
+        self._data: list[str] = []
+
+    def feed(self, chunk: bytes) -> list[tuple[str | None, str]]:
+        text = self._decoder.decode(chunk)
+        if self._pending is not None:
+            text = self._pending + text
+        lines = text.splitlines()
+        if lines and lines[-1] and text and lines[-1][-1] == text[-1]:
+            self._pending = lines.pop()
+        else:
+            self._pending = None
+
+        events = []
+        for line in lines:
+            if not line:
+                if self._data:
+                    events.append((self._event, "\n".join(self._data)))
+                self._event, self._data = None, []
+                continue
+            if line.startswith(":"):
+                continue
+            field, _, value = line.partition(":")
+            if value.startswith(" "):
+                value = value[1:]
+            if field == "event":
+                self._event = value
+            elif field == "data":
+                self._data.append(value)
+        return events
+
+
+def line_events(chunks: list[bytes]) -> Iterator[tuple[str | None, str]]:
+    reader = LineReader()
+    for chunk in chunks:
+        yield from reader.feed(chunk)
+
+
+def byte_events(chunks: list[bytes], events: frozenset[str] | None) -> Iterator[sse.SSEEvent]:
+    parser = sse.SSEParser(events)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def _decode_all(items: Iterable[tuple[str | None, str]]) -> int:
+    count = 0
+    for _, data in items:
+        if data != "[DONE]":
+            json.loads(data)
+        count += 1
+    return count
+
+
+def _decode_wanted(items: Iterable[sse.SSEEvent]) -> int:
+    count = 0
+    for event in items:
+        if event.data != b"[DONE]":
+            event.json()
+        count += 1
+    return count
+
+
+def rate(run: Callable[[], int], events: int) -> float:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.process_time()
+        run()
+        best = min(best, time.process_time() - started)
+    return events / best
+
+
+def allocated_per_event(feed: Callable[[bytes], list[Any]], chunks: list[bytes], events: int) -> float:
+    """
+    Sum of tracemalloc peak growth while each chunk is parsed, per event.
+    """
+    total = 0
+    tracemalloc.start()
+    try:
+        for chunk in chunks:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            feed(chunk)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / events
+
+
+def reference_events(stream: bytes, events: frozenset[str] | None) -> list[tuple[str | None, bytes]]:
+    """
+    Parse a whole stream line by line, as the SSE format describes it.
+    """
+    found: list[tuple[str | None, bytes]] = []
+    name: str | None = None
+    data: list[bytes] = []
+
+    def dispatch() -> None:
+        if data and (name is None or events is None or name in events):
+            found.append((name, b"\n".join(data)))
+
+    for line in stream.replace(b"\r\n", b"\n").split(b"\n"):
+        if not line:
+            dispatch()
+            name, data = None, []
+            continue
+        if line.startswith(b":"):
+            continue
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if field == b"data":
+            data.append(value)
+        elif field == b"event":
+            name = value.decode("utf-8")
+    # Like SSEParser.close, a stream that ends mid-event still yields it
+    dispatch()
+    return found
+
+
+def random_stream(rng: random.Random) -> bytes:
+    alphabet = ["a", "b", " ", ":", "{", '"', "é", "漢", "🙂", "x1"]
+    lines: list[str] = []
+    for _ in range(rng.randint(0, 12)):
+        if rng.random() < 0.2:
+            lines.append(": keep-alive" if rng.random() < 0.5 else ":")
+        if rng.random() < 0.6:
+            lines.append(f"event: {rng.choice(['wanted', 'other', 'ping'])}")
+        if rng.random() < 0.1:
+            lines.append(rng.choice(["id: 7", "retry: 1000", "id"]))
+        for _ in range(rng.choice([0, 1, 1, 1, 2, 3])):
+            value = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            lines.append(rng.choice(["data: ", "data:", "data:  "]) + value if value else rng.choice(["data", "data:"]))
+        lines.extend([""] * rng.choice([1, 1, 2]))
+    if lines and rng.random() < 0.2:
+        # Stream cut off without the final blank line
+        while lines and lines[-1] == "":
+            lines.pop()
+    crlf = rng.random()
+    return b"".join(line.encode("utf-8") + (b"\r\n" if rng.random() < crlf else b"\n") for line in lines)
+
+
+def check() -> None:
+    rng = random.Random(1)
+    for i in range(CHECK_STREAMS):
+        stream = random_stream(rng)
+        cuts = sorted(rng.sample(range(1, len(stream)), min(len(stream) - 1, rng.randint(0, 20)))) if len(stream) > 1 else []
+        chunks = [stream[a:b] for a, b in zip([0, *cuts], [*cuts, len(stream)])]
+        for wanted in (None, frozenset({"wanted"})):
+            expected = reference_events(stream, wanted)
+            got = [(event.event, event.data) for event in byte_events(chunks, wanted)]
+            if got != expected:
+                raise SystemExit(f"stream {i} ({wanted=}) differs:\n{stream!r}\nchunks {chunks!r}\ngot {got!r}\nexpected {expected!r}")
+    print(f"SSEParser matched the reference reader on {CHECK_STREAMS} randomized streams")
+
+
+def main() -> None:
+    rng = random.Random(0)
+    header = f"{'format':<20} {'parser':<6} {'events':>7} {'parse ev/s':>12} {'+json ev/s':>12} {'B/event':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, build, wanted in FORMATS:
+        stream = build(rng, EVENTS)
+        chunks = split(stream, rng)
+        total = sum(1 for _ in line_events(chunks))
+
+        line_parse = rate(lambda: sum(1 for _ in line_events(chunks)), total)
+        line_json = rate(lambda: _decode_all(line_events(chunks)), total)
+        byte_parse = rate(lambda: sum(1 for _ in byte_events(chunks, wanted)), total)
+        byte_json = rate(lambda: _decode_wanted(byte_events(chunks, wanted)), total)
+
+        line_bytes = allocated_per_event(LineReader().feed, chunks, total)
+        byte_bytes = allocated_per_event(sse.SSEParser(wanted).feed, chunks, total)
+
+        print(f"{name:<20} {'lines':<6} {total:>7} {line_parse:>12,.0f} {line_json:>12,.0f} {line_bytes:>9,.0f}")
+        print(f"{'':<20} {'bytes':<6} {total:>7} {byte_parse:>12,.0f} {byte_json:>12,.0f} {byte_bytes:>9,.0f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--check"]:
+        check()
+    else:
+        main()
@@ -0,0 +1,876 @@
+"""
+Local stand-in for the GPTProto prediction API.
+
+Implements enough of ``/api/v3`` to exercise the plugin without network
+access or credits:
+
+- ``POST /api/v3/<model path>`` submits a job that completes after
+  ``job_seconds``; a ``webhook`` query parameter gets a completion callback
+- ``GET /api/v3/predictions/<id>/result`` returns the job status;
+  ``garbage_polls`` answers that many polls with a non-JSON ``200``
+- ``POST /api/v3/predictions/<id>/cancel`` cancels a running job
+- ``GET /files/<id>.mp4`` serves the job's output, with ``Range`` and
+  ``If-Range`` support; ``drops`` cuts that many responses off halfway
+  and ``file_delay`` pauses that many seconds after every 64 KiB
+- ``GET /images/<name>.png`` serves an input image with an ``ETag`` and
+  answers a matching ``If-None-Match`` with ``304``
+- ``GET /slow/<name>.png`` trickles the first 40 bytes of that image at
+  10 bytes a second, for deadline checks
+- ``POST /v1/messages`` answers like Claude, blocking or streamed: the
+  first answer stops at ``max_tokens`` after a trailing space, and a
+  request with an assistant prefill gets the rest of it
+
+Run the built-in checks from the repository root:
+
+    python scripts/stub_gptproto.py --selfcheck
+
+or start the server on its own:
+
+    python scripts/stub_gptproto.py --port 9000
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _drain(updates: Any) -> Any:
+    """
+    Run a waiting generator to completion and return its result.
+    """
+    while True:
+        try:
+            next(updates)
+        except StopIteration as stop:
+            return stop.value
+
+
+class StubJob:
+    def __init__(self, job_id: str, duration: float, webhook: str | None):
+        self.id = job_id
+        self.created = time.monotonic()
+        self.duration = duration
+        self.webhook = webhook
+        self.polls = 0
+        self.cancelled = False
+
+    def status(self) -> str:
+        if self.cancelled:
+            return "cancelled"
+        return "completed" if time.monotonic() - self.created >= self.duration else "processing"
+
+    def body(self, base_url: str) -> dict[str, Any]:
+        data: dict[str, Any] = {"id": self.id, "status": self.status()}
+        if data["status"] == "completed":
+            data["outputs"] = [f"{base_url}/files/{self.id}.mp4"]
+        return {"code": 200, "data": data}
+
+
+class MemoryStorage(dict):
+    """
+    Dict-backed stand-in for Dify plugin storage.
+    """
+
+    def exist(self, key: str) -> bool:
+        return key in self
+
+    def get(self, key: str) -> bytes:  # type: ignore[override]
+        return self[key]
+
+    def set(self, key: str, val: bytes) -> None:
+        self[key] = val
+
+    def delete(self, key: str) -> None:
+        self.pop(key, None)
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients abandoning a download close the connection on purpose
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """
+    In-process stand-in server; ``start()`` returns its base URL.
+    """
+
+    def __init__(self, job_seconds: float = 1.0, host: str = "127.0.0.1", port: int = 0):
+        self.job_seconds = job_seconds
+        self.jobs: dict[str, StubJob] = {}
+        self.lock = threading.Lock()
+        # Output files: size, range support, version (ETag) and injected faults
+        self.file_size = 3 * 1024 * 1024 + 17
+        self.ranges = True
+        self.version = 1
+        self.drops = 0
+        self.file_delay = 0.0
+        self.garbage_polls = 0
+        self.file_requests: list[str | None] = []
+        self.messages: list[dict[str, Any]] = []
+        # Input images: size, version (ETag) and the status of each request
+        self.image_size = 40 * 1024
+        self.image_version = 1
+        self.image_statuses: list[int] = []
+        self.server = _QuietServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_base(self) -> str:
+        return f"{self.base_url}/api/v3"
+
+    def start(self) -> str:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def submit(self, webhook: str | None) -> StubJob:
+        job = StubJob(uuid.uuid4().hex, self.job_seconds, webhook)
+        with self.lock:
+            self.jobs[job.id] = job
+        if webhook:
+            threading.Timer(job.duration, self._send_webhook, args=(job,)).start()
+        return job
+
+    def file_content(self, name: str) -> bytes:
+        return random.Random(f"{name}/{self.version}").randbytes(self.file_size)
+
+    def image_content(self, name: str) -> bytes:
+        return b"\x89PNG\r\n\x1a\n" + random.Random(f"{name}/{self.image_version}").randbytes(self.image_size)
+
+    def _send_webhook(self, job: StubJob) -> None:
+        import requests
+
+        if job.cancelled:
+            return
+        try:
+            requests.post(job.webhook, json=job.body(self.base_url)["data"], timeout=5)
+        except requests.exceptions.RequestException as e:
+            print(f"webhook delivery for {job.id} failed: {e}", file=sys.stderr)
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, status: int, body: dict[str, Any]) -> None:
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_message(self, body: dict[str, Any]) -> None:
+                with stub.lock:
+                    stub.messages.append(body)
+                if body["messages"][-1]["role"] == "assistant":
+                    deltas, stop_reason = [" and", " ends here."], "end_turn"
+                else:
+                    deltas, stop_reason = ["The answer", " is cut", " "], "max_tokens"
+                if not body.get("stream"):
+                    self._send_json(200, {
+                        "content": [{"type": "text", "text": "".join(deltas)}],
+                        "stop_reason": stop_reason,
+                        "usage": {"input_tokens": 5, "output_tokens": len(deltas)},
+                    })
+                    return
+                events = [
+                    ("message_start", {"message": {"usage": {"input_tokens": 5}}}),
+                    ("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}}),
+                    *(("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": delta}}) for delta in deltas),
+                    ("message_delta", {"delta": {"stop_reason": stop_reason}, "usage": {"output_tokens": len(deltas)}}),
+                    ("message_stop", {}),
+                ]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for name, data in events:
+                    self.wfile.write(f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.close_connection = True
+
+            def do_POST(self) -> None:
+                url = urlparse(self.path)
+                payload = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+                if url.path == "/v1/messages":
+                    self._send_message(json.loads(payload))
+                    return
+                if not url.path.startswith("/api/v3/"):
+                    self._send_json(404, {"message": "not found"})
+                    return
+                parts = url.path.strip("/").split("/")
+                if len(parts) == 5 and parts[:3] == ["api", "v3", "predictions"] and parts[4] == "cancel":
+                    job = stub.jobs.get(parts[3])
+                    if job is None:
+                        self._send_json(404, {"message": "prediction not found"})
+                        return
+                    if job.status() == "processing":
+                        job.cancelled = True
+                    self._send_json(200, job.body(stub.base_url))
+                    return
+                webhook = parse_qs(url.query).get("webhook", [None])[0]
+                job = stub.submit(webhook)
+                self._send_json(200, {"code": 200, "data": {"id": job.id, "status": "created"}})
+
+            def _send_file(self, name: str) -> None:
+                content = stub.file_content(name)
+                etag = f'"{name}-{stub.version}"'
+                requested = self.headers.get("Range")
+                start, end = 0, len(content) - 1
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", requested or "")
+                if_range = self.headers.get("If-Range")
+                partial = stub.ranges and match and (if_range is None or if_range == etag)
+                if partial:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2) or end), end)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                body = content[start : end + 1]
+                with stub.lock:
+                    stub.file_requests.append(requested)
+                    drop = stub.drops > 0 and len(body) > 1
+                    stub.drops -= drop
+                if drop:
+                    # Send half the body, then drop the connection
+                    self.wfile.write(body[: len(body) // 2])
+                    self.close_connection = True
+                    return
+                if stub.file_delay > 0:
+                    for start in range(0, len(body), 64 * 1024):
+                        self.wfile.write(body[start : start + 64 * 1024])
+                        self.wfile.flush()
+                        time.sleep(stub.file_delay)
+                    return
+                self.wfile.write(body)
+
+            def _send_image(self, name: str) -> None:
+                etag = f'"{name}-{stub.image_version}"'
+                status = 304 if self.headers.get("If-None-Match") == etag else 200
+                with stub.lock:
+                    stub.image_statuses.append(status)
+                content = stub.image_content(name) if status == 200 else b""
+                self.send_response(status)
+                self.send_header("ETag", etag)
+                if status == 200:
+                    self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _send_slowly(self, name: str) -> None:
+                content = stub.image_content(name)[:40]
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                for start in range(0, len(content), 10):
+                    self.wfile.write(content[start : start + 10])
+                    self.wfile.flush()
+                    time.sleep(1)
+
+            def do_GET(self) -> None:
+                parts = urlparse(self.path).path.strip("/").split("/")
+                if len(parts) == 2 and parts[0] == "files":
+                    self._send_file(parts[1])
+                    return
+                if len(parts) == 2 and parts[0] == "images":
+                    self._send_image(parts[1])
+                    return
+                if len(parts) == 2 and parts[0] == "slow":
+                    self._send_slowly(parts[1])
+                    return
+                if len(parts) == 5 and parts[:3] == ["api", "v3", "predictions"] and parts[4] == "result":
+                    job = stub.jobs.get(parts[3])
+                    if job is None:
+                        self._send_json(404, {"message": "prediction not found"})
+                        return
+                    job.polls += 1
+                    with stub.lock:
+                        garbage = stub.garbage_polls > 0
+                        stub.garbage_polls -= garbage
+                    if garbage:
+                        # A proxy error page with a success status
+                        payload = b"<html>upstream hiccup</html>"
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/html")
+                        self.send_header("Content-Length", str(len(payload)))
+                        self.end_headers()
+                        self.wfile.write(payload)
+                        return
+                    self._send_json(200, job.body(stub.base_url))
+                    return
+                self._send_json(404, {"message": "not found"})
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return _Handler
+
+
+def _check_webhook(stub: StubServer) -> None:
+    from utils import http_pool, poll_schedule, predictions, webhook
+    from utils.deadline import Deadline
+
+    webhook.configure(None, host="127.0.0.1", port=0)
+    try:
+        response = http_pool.post(
+            f"{stub.api_base}/google/veo3.1/text-to-video",
+            params=webhook.submit_params(),
+            json={},
+        )
+        result_id = response.json()["data"]["id"]
+        started = time.monotonic()
+        url = _drain(predictions.poll_result({}, result_id, Deadline(30), "video_url", schedule=poll_schedule.VIDEO))
+        elapsed = time.monotonic() - started
+        polls = stub.jobs[result_id].polls
+        assert url and url.endswith(f"{result_id}.mp4"), url
+        assert elapsed < stub.job_seconds + 1, f"webhook took {elapsed:.1f}s"
+        assert polls == 0, f"expected no polls before the safety net, got {polls}"
+        print(f"webhook: resolved in {elapsed:.2f}s with {polls} polls")
+    finally:
+        webhook.disable()
+
+
+def _check_polling(stub: StubServer) -> None:
+    from utils import http_pool, poll_schedule, predictions
+    from utils.deadline import Deadline
+
+    response = http_pool.post(f"{stub.api_base}/google/veo3.1/text-to-video", json={})
+    result_id = response.json()["data"]["id"]
+    schedule = poll_schedule.PollSchedule(initial=0.2, multiplier=1.5, max_interval=1.0)
+    url = _drain(predictions.poll_result({}, result_id, Deadline(30), "video_url", schedule=schedule))
+    assert url and url.endswith(f"{result_id}.mp4"), url
+    print(f"polling: resolved with {stub.jobs[result_id].polls} polls")
+
+
+def _check_resume(stub: StubServer) -> None:
+    from utils import http_pool, poll_schedule, predictions, task_journal
+    from utils.deadline import Deadline, DeadlineExceededError
+
+    journal = task_journal.TaskJournal(MemoryStorage())
+    response = http_pool.post(f"{stub.api_base}/openai/reverse/sora-2/text-to-video", json={})
+    result_id = response.json()["data"]["id"]
+    journal.record_submit(result_id, endpoint="openai/reverse/sora-2/text-to-video", url_key="video_url", parameters={})
+    schedule = poll_schedule.PollSchedule(initial=0.1, multiplier=1.0, max_interval=0.1)
+    try:
+        updates = predictions.poll_result(
+            {},
+            result_id,
+            Deadline(0.2),
+            "video_url",
+            schedule=schedule,
+            journal=journal,
+            cancel_on=frozenset({predictions.CANCEL_ABANDONED, predictions.CANCEL_ERROR}),
+        )
+        _drain(updates)
+        raise AssertionError("expected the short deadline to expire")
+    except DeadlineExceededError as e:
+        assert "fetch_prediction_result" in str(e), e
+    assert journal.get(result_id)["status"] == task_journal.TIMED_OUT
+
+    url = _drain(predictions.poll_result({}, result_id, Deadline(30), "video_url", schedule=schedule, journal=journal))
+    assert url and url.endswith(f"{result_id}.mp4"), url
+    # Collected, so nothing is left in storage for it
+    assert journal.get(result_id) is None and result_id not in journal._load_index()
+    print(f"resume: collected {result_id} after the first wait timed out")
+
+
+def _check_journal_retention(stub: StubServer) -> None:
+    from utils import task_journal
+
+    storage = MemoryStorage()
+    journal = task_journal.TaskJournal(storage)
+    parameters = {"prompt": "x" * 5000, "image_url": "https://example.com/" + "y" * 2000}
+    for i in range(task_journal.MAX_ENTRIES + 50):
+        journal.record_submit(f"job{i}", endpoint="model", url_key="url", parameters=parameters)
+    journal.update("job249", task_journal.TIMED_OUT)
+    journal.update("job248", task_journal.FAILED, error="boom")
+    entries = [key for key in storage if key != task_journal.INDEX_KEY]
+    assert len(entries) == task_journal.MAX_ENTRIES - 1, len(entries)
+    assert journal.get("job0") is None and journal.get("job249")["status"] == task_journal.TIMED_OUT
+    assert len(journal.get("job249")["prompt"]) == task_journal.PROMPT_CHARS and "parameters" not in journal.get("job249")
+
+    # Entries past the TTL are pruned on the next submit
+    index = journal._load_index()
+    journal._save_index({result_id: submitted_at - task_journal.TTL - 1 for result_id, submitted_at in index.items()})
+    journal.record_submit("fresh", endpoint="model", url_key="url", parameters={})
+    assert sorted(storage) == sorted([task_journal.INDEX_KEY, "task_journal_fresh"]), sorted(storage)
+    size = sum(len(value) for value in storage.values())
+    print(f"journal: capped at {task_journal.MAX_ENTRIES} open entries, finished and expired ones removed ({size} bytes left)")
+
+
+def _check_cancel(stub: StubServer) -> None:
+    from utils import http_pool, poll_schedule, predictions, task_journal
+    from utils.deadline import Deadline, DeadlineExceededError
+
+    journal = task_journal.TaskJournal(MemoryStorage())
+    schedule = poll_schedule.PollSchedule(initial=0.1, multiplier=1.0, max_interval=0.1)
+    stub.job_seconds, job_seconds = 30, stub.job_seconds
+    try:
+        # Abandoned: the caller closes the generator while waiting
+        result_id = http_pool.post(f"{stub.api_base}/google/veo3.1/text-to-video", json={}).json()["data"]["id"]
+        updates = predictions.poll_result({}, result_id, Deadline(30), "video_url", schedule=schedule, journal=journal)
+        next(updates)
+        updates.close()
+        assert stub.jobs[result_id].cancelled, "closing the wait did not cancel the job"
+        assert journal.get(result_id) is None, "a cancelled job stayed in the journal"
+
+        # Deadline: the job is cancelled instead of left running
+        result_id = http_pool.post(f"{stub.api_base}/google/veo3.1/text-to-video", json={}).json()["data"]["id"]
+        try:
+            _drain(predictions.poll_result({}, result_id, Deadline(0.3), "video_url", schedule=schedule, journal=journal))
+            raise AssertionError("expected the short deadline to expire")
+        except DeadlineExceededError as e:
+            assert "cancelled" in str(e), e
+        assert stub.jobs[result_id].cancelled, "deadline did not cancel the job"
+        assert journal.get(result_id) is None, "a cancelled job stayed in the journal"
+
+        # fetch_prediction_result waits with cancel_on=frozenset(): nothing cancels
+        result_id = http_pool.post(f"{stub.api_base}/google/veo3.1/text-to-video", json={}).json()["data"]["id"]
+        updates = predictions.poll_result({}, result_id, Deadline(30), "video_url", schedule=schedule, cancel_on=frozenset())
+        next(updates)
+        updates.close()
+        try:
+            _drain(predictions.poll_result({}, result_id, Deadline(0.3), "video_url", schedule=schedule, cancel_on=frozenset()))
+            raise AssertionError("expected the short deadline to expire")
+        except DeadlineExceededError as e:
+            assert "fetch_prediction_result" in str(e), e
+        assert not stub.jobs[result_id].cancelled, "a wait with cancel_on=frozenset() cancelled the job"
+    finally:
+        stub.job_seconds = job_seconds
+    print("cancel: abandoned and timed-out jobs were cancelled, resumed waits left them running")
+
+
+def _check_download(stub: StubServer) -> None:
+    import hashlib
+    import io
+    import tempfile
+
+    from utils import blob_stream, download
+    from utils.deadline import Deadline, DeadlineExceededError
+
+    url = f"{stub.base_url}/files/check.mp4"
+    expected = stub.file_content("check.mp4")
+    min_segment = 1024 * 1024
+
+    # Parallel ranges
+    stub.file_requests.clear()
+    with tempfile.TemporaryFile() as file:
+        length = download.download(url, file, Deadline(30), segments=4, min_segment=min_segment)
+        file.seek(0)
+        assert length == len(expected) and file.read() == expected, "ranged download is corrupt"
+    ranged = [r for r in stub.file_requests if r and r != "bytes=0-0"]
+    assert len(ranged) == 3, stub.file_requests
+
+    # Dropped connections are resumed from the last byte received
+    stub.file_requests.clear()
+    stub.drops = 2
+    with tempfile.TemporaryFile() as file:
+        download.download(url, file, Deadline(30), segments=4, min_segment=min_segment)
+        file.seek(0)
+        assert file.read() == expected, "resumed download is corrupt"
+    # The probe, three ranges and one resume request per drop
+    assert len(stub.file_requests) == 6, stub.file_requests
+    print(f"download: {len(expected)} bytes in {len(ranged)} parallel ranges, resumed after 2 dropped connections")
+
+    # Servers without range support get one plain GET
+    stub.ranges = False
+    try:
+        buffer = io.BytesIO()
+        assert download.download(url, buffer, Deadline(30)) == len(expected) and buffer.getvalue() == expected
+    finally:
+        stub.ranges = True
+
+    # A file that changes mid-download fails instead of mixing versions
+    version = stub.version
+    original = download._fetch_segment
+
+    def change_then_fetch(*args: Any, **kwargs: Any) -> None:
+        stub.version = version + 1
+        original(*args, **kwargs)
+
+    download._fetch_segment = change_then_fetch
+    try:
+        download.download(url, io.BytesIO(), Deadline(30), segments=4, min_segment=min_segment)
+        raise AssertionError("expected the changed file to fail")
+    except download.DownloadError as e:
+        assert "HTTP 200" in str(e), e
+    finally:
+        download._fetch_segment = original
+        stub.version = version
+
+    # End to end into blob chunks
+    digest = hashlib.sha256()
+    chunks = list(blob_stream.stream_file(url, Deadline(30), "video/mp4"))
+    for message in chunks[:-1]:
+        assert len(message.message.blob) <= blob_stream.CHUNK_SIZE
+        digest.update(message.message.blob)
+    assert chunks[-1].message.end and digest.digest() == hashlib.sha256(expected).digest()
+    print("download: plain GET fallback, changed-file detection and blob streaming verified")
+
+    # A server that keeps sending, slowly, is cut off at the deadline
+    slow = f"{stub.base_url}/slow/trickle.png"
+    stub.file_delay = 0.2
+    try:
+        for name, fetch in (
+            ("plain GET", lambda deadline: download.download(slow, io.BytesIO(), deadline)),
+            ("ranges", lambda deadline: download.download(url, io.BytesIO(), deadline, segments=4, min_segment=min_segment)),
+            ("blob stream", lambda deadline: list(blob_stream.stream_file(slow, deadline, "image/png"))),
+        ):
+            started = time.monotonic()
+            try:
+                fetch(Deadline(1.0))
+                raise AssertionError(f"{name}: expected the deadline to stop a slow download")
+            except DeadlineExceededError:
+                pass
+            elapsed = time.monotonic() - started
+            assert elapsed < 1.5, f"{name}: slow download stopped after {elapsed:.1f}s"
+    finally:
+        stub.file_delay = 0.0
+    print("download: slow downloads stopped at the deadline")
+
+
+def _check_pool_stats(stub: StubServer) -> None:
+    import logging
+
+    from utils import http_pool
+
+    records: list[logging.LogRecord] = []
+    handler = logging.Handler(logging.INFO)
+    handler.emit = records.append  # type: ignore[method-assign]
+    logger = logging.getLogger(http_pool.__name__)
+    saved = http_pool.POOL_STATS_EVERY, logger.level
+    http_pool.POOL_STATS_EVERY = 3
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    try:
+        host = urlparse(stub.base_url).hostname
+        before = http_pool.pool_stats().get(host, {"hits": 0, "misses": 0})
+        for _ in range(3):
+            http_pool.get(f"{stub.api_base}/predictions/missing/result", timeout=5).close()
+        after = http_pool.pool_stats()[host]
+    finally:
+        logger.removeHandler(handler)
+        http_pool.POOL_STATS_EVERY, level = saved
+        logger.setLevel(level)
+    # One connection at most is opened; the other requests reuse it
+    assert after["hits"] - before["hits"] >= 2, (before, after)
+    summaries = [r.getMessage() for r in records if r.getMessage().startswith("Connection reuse after")]
+    assert len(summaries) == 1 and f"{host} {after['hits']} hits" in summaries[0], summaries
+    print(f"pool stats: {after['hits']} hits / {after['misses']} misses for {host}, logged as {summaries[0]!r}")
+
+
+def _check_http2_client(stub: StubServer) -> None:
+    try:
+        import httpx
+    except ImportError:
+        print("http2 client: skipped, httpx is not installed")
+        return
+    import requests
+
+    from utils import http_pool, poll_schedule, predictions
+    from utils.deadline import Deadline
+
+    # The stub speaks HTTP/1.1 only, so an httpx client stands in for the
+    # HTTP/2 one; everything above the transport is the same
+    saved = http_pool.HTTP2_ENABLED, http_pool.HTTP2_PREFIXES, http_pool._http2_client
+    http_pool.HTTP2_ENABLED, http_pool.HTTP2_PREFIXES = True, (stub.api_base,)
+    http_pool._http2_client = httpx.Client()
+    try:
+        response = http_pool.post(f"{stub.api_base}/google/veo3.1/text-to-video", json={})
+        assert isinstance(response, requests.Response) and response.ok, response
+        assert response.headers["content-type"] == "application/json"
+        assert b"".join(response.iter_content(chunk_size=7)) == response.content
+        result_id = response.json()["data"]["id"]
+
+        # A non-JSON 200 is retried, as it is over HTTP/1.1, instead of failing the wait
+        stub.garbage_polls = 2
+        schedule = poll_schedule.PollSchedule(initial=0.1, multiplier=1.0, max_interval=0.1)
+        url = _drain(predictions.poll_result({}, result_id, Deadline(30), "video_url", schedule=schedule))
+        assert url and url.endswith(f"{result_id}.mp4") and stub.garbage_polls == 0, url
+
+        missing = http_pool.get(f"{stub.api_base}/predictions/missing/result")
+        try:
+            missing.raise_for_status()
+            raise AssertionError("expected HTTP 404 to raise")
+        except requests.exceptions.HTTPError:
+            pass
+
+        stub.job_seconds, job_seconds = 30, stub.job_seconds
+        try:
+            result_id = http_pool.post(f"{stub.api_base}/google/veo3.1/text-to-video", json={}).json()["data"]["id"]
+            assert predictions.cancel_prediction({}, result_id) and stub.jobs[result_id].cancelled
+        finally:
+            stub.job_seconds = job_seconds
+
+        http_pool.HTTP2_PREFIXES = ("http://127.0.0.1:9/",)
+        try:
+            http_pool.get("http://127.0.0.1:9/api/v3/predictions/x/result", timeout=2)
+            raise AssertionError("expected a refused connection")
+        except requests.exceptions.ConnectionError:
+            pass
+    finally:
+        http_pool._http2_client.close()
+        http_pool.HTTP2_ENABLED, http_pool.HTTP2_PREFIXES, http_pool._http2_client = saved
+    print("http2 client: responses and errors match the requests transport")
+
+
+def _check_media_cache(stub: StubServer) -> None:
+    import base64
+    import os
+    import tempfile
+
+    from utils import inline_media, media_cache, media_type, prefetch
+    from utils.deadline import Deadline, DeadlineExceededError
+
+    def fetch(name: str, query: str = "") -> bytes:
+        data = inline_media.fetch(f"{stub.base_url}/images/{name}{query}", Deadline(30))
+        return b"".join(data.chunks())
+
+    def blobs() -> list[os.DirEntry]:
+        return [f for f in os.scandir(os.path.join(directory, "blobs")) if f.name.endswith(".b64")]
+
+    saved = media_cache._cache
+    with tempfile.TemporaryDirectory() as directory:
+        # Default budgets: memory off, so the plugin stays within its declared memory
+        cache = media_cache._cache = media_cache.MediaCache(directory)
+        try:
+            stub.image_statuses.clear()
+            expected = base64.b64encode(stub.image_content("a.png"))
+            assert fetch("a.png") == expected
+            # Revalidated with a conditional GET and served from the cache
+            assert fetch("a.png") == expected
+            assert stub.image_statuses == [200, 304], stub.image_statuses
+            assert cache.stats()["hits"] == 1 and cache.stats()["memory_bytes"] == 0, cache.stats()
+
+            # The same bytes behind another URL are stored once
+            assert fetch("a.png", "?copy=1") == expected
+            assert len(blobs()) == 1, blobs()
+
+            # A changed image is downloaded again, not served stale
+            stub.image_version += 1
+            assert fetch("a.png") == base64.b64encode(stub.image_content("a.png"))
+            assert stub.image_statuses[-1] == 200, stub.image_statuses
+
+            # Least recently used payloads go once the disk budget is exceeded
+            budget = 2 * len(expected) + 100
+            cache = media_cache._cache = media_cache.MediaCache(directory, memory_bytes=0, disk_bytes=budget)
+            for name in ("b.png", "c.png", "d.png"):
+                fetch(name)
+            assert sum(f.stat().st_size for f in blobs()) <= budget, [f.name for f in blobs()]
+
+            # A slow image is cut off at the deadline, not when it finishes
+            started = time.monotonic()
+            try:
+                inline_media.fetch(f"{stub.base_url}/slow/inline.png", Deadline(1.0))
+                raise AssertionError("expected the deadline to stop a slow image download")
+            except DeadlineExceededError:
+                pass
+            elapsed = time.monotonic() - started
+            assert elapsed < 1.5, f"slow image download stopped after {elapsed:.1f}s"
+
+            # A lone call runs on the caller's thread, bounded by the same checks
+            started = time.monotonic()
+            deadline = Deadline(1.0)
+            try:
+                prefetch.gather({"image": lambda: inline_media.fetch(f"{stub.base_url}/slow/single.png", deadline)}, deadline)
+                raise AssertionError("expected the deadline to stop a single prefetch")
+            except DeadlineExceededError:
+                pass
+            elapsed = time.monotonic() - started
+            assert elapsed < 1.5, f"single prefetch stopped after {elapsed:.1f}s"
+
+            # The ranged probe of a file URL is bounded the same way
+            started = time.monotonic()
+            try:
+                media_type.probe(f"{stub.base_url}/slow/probe.png", Deadline(1.0))
+                raise AssertionError("expected the deadline to stop a slow probe")
+            except DeadlineExceededError:
+                pass
+            elapsed = time.monotonic() - started
+            assert elapsed < 1.5, f"slow probe stopped after {elapsed:.1f}s"
+        finally:
+            media_cache._cache = saved
+    print("media cache: 304 reuse, dedupe by digest, changed-image refetch and disk eviction verified")
+    print("inline media: slow image download stopped at the deadline, alone and through prefetch, and so was a slow probe")
+
+
+class _RecordingTool:
+    """
+    Stand-in for a Dify tool that keeps the messages it is asked to create.
+    """
+
+    def __init__(self) -> None:
+        self.texts: list[str] = []
+
+    def create_text_message(self, text: str) -> str:
+        self.texts.append(text)
+        return text
+
+    def create_variable_message(self, name: str, value: Any) -> tuple[str, Any]:
+        return name, value
+
+
+def _check_continuation(stub: StubServer) -> None:
+    from utils import continuation, http_pool, text_stream
+    from utils.deadline import Deadline
+
+    url = f"{stub.base_url}/v1/messages"
+    data = {"model": "claude", "max_tokens": 3, "messages": [{"role": "user", "content": "Go"}]}
+    expected = "The answer is cut and ends here."
+
+    def post(body: dict[str, Any]) -> dict[str, Any]:
+        return http_pool.post(url, json=body, timeout=10).json()
+
+    stub.messages.clear()
+    text = continuation.generate(
+        post,
+        data,
+        extract=lambda result: "".join(block["text"] for block in result["content"]),
+        stop_reason=lambda result: result.get("stop_reason"),
+        builder=continuation.anthropic,
+    )
+    assert text == expected, repr(text)
+    assert stub.messages[-1]["messages"][-1] == {"role": "assistant", "content": "The answer is cut"}, stub.messages
+
+    stub.messages.clear()
+    tool = _RecordingTool()
+    text = _drain(text_stream.stream_text(
+        tool,  # type: ignore[arg-type]
+        url,
+        {},
+        {**data, "stream": True},
+        parse=text_stream.anthropic_deltas,
+        deadline=Deadline(30),
+        events=text_stream.ANTHROPIC_EVENTS,
+        continue_with=continuation.anthropic,
+    ))
+    assert text == expected, repr(text)
+    assert "".join(tool.texts) == expected, tool.texts
+    assert len(stub.messages) == 2 and stub.messages[-1]["messages"][-1]["content"] == "The answer is cut", stub.messages
+    print("continuation: max_tokens answers continued without doubled whitespace, blocking and streamed")
+
+
+def _check_media_type(stub: StubServer) -> None:
+    from utils import media_type
+    from utils.deadline import Deadline
+
+    sniffed = {
+        b"\xff\xfeh\x00i\x00": "text/plain",  # UTF-16LE, not MPEG audio
+        b"\xff\xfb\x90\x64": "audio/mpeg",
+        b"\x00\x00\x00\x1cftypavif": "image/avif",
+        b"\x00\x00\x00\x1cftypmp42": "video/mp4",
+        b"\x00\x00\x00\x1cftypzzzz": None,
+    }
+    for head, expected in sniffed.items():
+        assert media_type.sniff(head) == expected, (head, media_type.sniff(head))
+
+    deadline = Deadline(30)
+    video = media_type.VIDEO_TYPES
+    # Read and identified from the header
+    assert media_type.probe(f"{stub.base_url}/files/probe.mp4", deadline, allowed=video) == "video/mp4"
+    # Not readable here: Gemini may still be able to fetch these
+    assert media_type.probe("gs://bucket/clip.mov", deadline, allowed=video) == "video/quicktime"
+    assert media_type.probe("gs://bucket/clip", deadline, allowed=video, default="video/mp4") == "video/mp4"
+    assert media_type.probe(f"{stub.base_url}/private/doc.pdf?sig=1", deadline) == "application/pdf"
+    # Read and identified as unsupported
+    try:
+        media_type.probe(f"{stub.base_url}/api/v3/predictions/missing/result", deadline, allowed=video)
+    except media_type.MediaError:
+        raise AssertionError("an error status was treated as the file's content") from None
+    try:
+        media_type.probe(f"{stub.base_url}/files/probe.mp4", deadline, allowed=media_type.IMAGE_TYPES)
+        raise AssertionError("expected a video to be rejected as an image")
+    except media_type.MediaError as e:
+        assert "video/mp4" in str(e), e
+    print("media type: sniffing, unreadable-URL fallback and rejection verified")
+
+
+CHECKS = [
+    _check_polling,
+    _check_webhook,
+    _check_resume,
+    _check_journal_retention,
+    _check_cancel,
+    _check_download,
+    _check_media_type,
+    _check_media_cache,
+    _check_continuation,
+    _check_pool_stats,
+    _check_http2_client,
+]
+
+
+def selfcheck(job_seconds: float) -> None:
+    # httpcore imports trio when it is installed, and trio needs the
+    # select.epoll that gevent's patching removes
+    try:
+        import httpcore  # noqa: F401
+    except ImportError:
+        pass
+    # blob_stream imports dify_plugin, which monkey-patches threading; that
+    # has to happen before the server thread starts
+    from utils import blob_stream, predictions  # noqa: F401
+
+    stub = StubServer(job_seconds=job_seconds)
+    stub.start()
+    predictions.API_BASE = stub.api_base
+    try:
+        for check in CHECKS:
+            check(stub)
+    finally:
+        stub.stop()
+    print("all checks passed")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--job-seconds", type=float, default=1.0)
+    parser.add_argument("--selfcheck", action="store_true", help="run the built-in checks and exit")
+    args = parser.parse_args()
+
+    if args.selfcheck:
+        selfcheck(args.job_seconds)
+        return
+
+    stub = StubServer(job_seconds=args.job_seconds, host=args.host, port=args.port)
+    print(f"Stub GPTProto API listening on {stub.api_base}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@ import os
 from collections.abc import Generator
 from typing import Any
 
-import requests
-
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils import continuation, http_pool, text_stream
+from utils.deadline import Deadline
+
 API_BASE = "https://gptproto.com/v1"
+DEFAULT_DEADLINE = 300  # Extended thinking answers can take minutes
 
 
 class ClaudeOpus45TextGenerationTool(Tool):
@@ -35,8 +37,25 @@ class ClaudeOpus45TextGenerationTool(Tool):
         file_url = tool_parameters.get("file_url", "")
         enable_web_search = tool_parameters.get("enable_web_search", False)
         max_tokens = tool_parameters.get("max_tokens", 4096)
+        stream = tool_parameters.get("stream", False)
+
+        deadline = Deadline.from_parameters(tool_parameters, self.runtime.credentials, DEFAULT_DEADLINE)
 
         try:
+            if stream:
+                # Stream text as it is generated
+                text = yield from self._stream_text(
+                    api_key=api_key,
+                    prompt=prompt,
+                    file_url=file_url,
+                    enable_web_search=enable_web_search,
+                    max_tokens=max_tokens,
+                    deadline=deadline,
+                )
+                if not text:
+                    yield self.create_text_message("Error: Failed to generate text")
+                return
+
             # Call API directly
             result = self._generate_text(
                 api_key=api_key,
@@ -44,6 +63,7 @@ class ClaudeOpus45TextGenerationTool(Tool):
                 file_url=file_url,
                 enable_web_search=enable_web_search,
                 max_tokens=max_tokens,
+                deadline=deadline,
             )
 
             if result:
@@ -54,16 +74,16 @@ class ClaudeOpus45TextGenerationTool(Tool):
         except Exception as e:
             yield self.create_text_message(f"Error: {str(e)}")
 
-    def _generate_text(
+    def _build_request(
         self,
         api_key: str,
         prompt: str,
         file_url: str,
         enable_web_search: bool,
         max_tokens: int,
-    ) -> str | None:
+    ) -> tuple[str, dict[str, str], dict[str, Any]]:
         """
-        Generate text using Claude Opus 4.5 API.
+        Build the URL, headers and body of a Claude Opus 4.5 chat completions request.
         """
         url = f"{API_BASE}/chat/completions"
         headers = {
@@ -115,13 +135,71 @@ class ClaudeOpus45TextGenerationTool(Tool):
                 }
             ]
 
-        response = requests.post(url, headers=headers, json=data, timeout=120)
+        return url, headers, data
+
+    def _stream_text(
+        self,
+        api_key: str,
+        prompt: str,
+        file_url: str,
+        enable_web_search: bool,
+        max_tokens: int,
+        deadline: Deadline,
+    ) -> Generator[ToolInvokeMessage, None, str]:
+        """
+        Stream text from Claude Opus 4.5, yielding deltas as they arrive.
+        """
+        url, headers, data = self._build_request(api_key, prompt, file_url, enable_web_search, max_tokens)
+        data["stream"] = True
+        data["stream_options"] = {"include_usage": True}
+
+        return (
+            yield from text_stream.stream_text(
+                self,
+                url,
+                headers,
+                data,
+                parse=text_stream.openai_chat_deltas,
+                deadline=deadline,
+                continue_with=continuation.openai_chat,
+            )
+        )
+
+    def _generate_text(
+        self,
+        api_key: str,
+        prompt: str,
+        file_url: str,
+        enable_web_search: bool,
+        max_tokens: int,
+        deadline: Deadline,
+    ) -> str | None:
+        """
+        Generate text using Claude Opus 4.5 API.
+        """
+        url, headers, data = self._build_request(api_key, prompt, file_url, enable_web_search, max_tokens)
+
+        def post(body: dict[str, Any]) -> dict[str, Any]:
+            response = http_pool.post(url, headers=headers, json=body, timeout=deadline.timeout())
 
-        if response.status_code != 200:
-            raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
+            if response.status_code != 200:
+                raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
 
-        result = response.json()
+            return response.json()
 
+        # Answers cut off at max_tokens are continued with follow-up requests
+        return continuation.generate(
+            post,
+            data,
+            extract=self._extract_text,
+            stop_reason=self._finish_reason,
+            builder=continuation.openai_chat,
+        )
+
+    def _extract_text(self, result: dict[str, Any]) -> str | None:
+        """
+        Extract the answer text from a chat completions response.
+        """
         # Extract text from OpenAI-compatible response
         # Response format: {"choices": [{"message": {"content": "..."}}]}
         choices = result.get("choices", [])
@@ -154,3 +232,10 @@ class ClaudeOpus45TextGenerationTool(Tool):
                 return data_obj.get("text") or data_obj.get("content") or data_obj.get("output")
 
         return None
+
+    def _finish_reason(self, result: dict[str, Any]) -> str | None:
+        """
+        Read why the first choice stopped ("length" when it hit max_tokens).
+        """
+        choices = result.get("choices") or [{}]
+        return choices[0].get("finish_reason") or result.get("stop_reason")
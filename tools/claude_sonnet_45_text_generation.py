@@ -1,12 +1,14 @@
 from collections.abc import Generator
 from typing import Any
 
-import requests
-
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils import continuation, http_pool, text_stream
+from utils.deadline import Deadline
+
 API_BASE = "https://gptproto.com/v1"
+DEFAULT_DEADLINE = 120
 
 
 class ClaudeSonnet45TextGenerationTool(Tool):
@@ -34,8 +36,25 @@ class ClaudeSonnet45TextGenerationTool(Tool):
         document_url = tool_parameters.get("document_url", "")
         enable_web_search = tool_parameters.get("enable_web_search", False)
         max_tokens = tool_parameters.get("max_tokens", 4096)
+        stream = tool_parameters.get("stream", True)
+
+        deadline = Deadline.from_parameters(tool_parameters, self.runtime.credentials, DEFAULT_DEADLINE)
 
         try:
+            if stream:
+                # Stream text as it is generated
+                text = yield from self._stream_text(
+                    api_key=api_key,
+                    prompt=prompt,
+                    document_url=document_url,
+                    enable_web_search=enable_web_search,
+                    max_tokens=max_tokens,
+                    deadline=deadline,
+                )
+                if not text:
+                    yield self.create_text_message("Error: Failed to generate text")
+                return
+
             # Call API directly
             result = self._generate_text(
                 api_key=api_key,
@@ -43,6 +62,7 @@ class ClaudeSonnet45TextGenerationTool(Tool):
                 document_url=document_url,
                 enable_web_search=enable_web_search,
                 max_tokens=max_tokens,
+                deadline=deadline,
             )
 
             if result:
@@ -53,16 +73,16 @@ class ClaudeSonnet45TextGenerationTool(Tool):
         except Exception as e:
             yield self.create_text_message(f"Error: {str(e)}")
 
-    def _generate_text(
+    def _build_request(
         self,
         api_key: str,
         prompt: str,
         document_url: str,
         enable_web_search: bool,
         max_tokens: int,
-    ) -> str | None:
+    ) -> tuple[str, dict[str, str], dict[str, Any]]:
         """
-        Generate text using Claude Sonnet 4.5 API.
+        Build the URL, headers and body of a Claude Sonnet 4.5 messages request.
         """
         url = f"{API_BASE}/messages"
         headers = {
@@ -113,13 +133,71 @@ class ClaudeSonnet45TextGenerationTool(Tool):
                 }
             ]
 
-        response = requests.post(url, headers=headers, json=data, timeout=120)
+        return url, headers, data
 
-        if response.status_code != 200:
-            raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
+    def _stream_text(
+        self,
+        api_key: str,
+        prompt: str,
+        document_url: str,
+        enable_web_search: bool,
+        max_tokens: int,
+        deadline: Deadline,
+    ) -> Generator[ToolInvokeMessage, None, str]:
+        """
+        Stream text from Claude Sonnet 4.5, yielding deltas as they arrive.
+        """
+        url, headers, data = self._build_request(api_key, prompt, document_url, enable_web_search, max_tokens)
+        data["stream"] = True
+
+        return (
+            yield from text_stream.stream_text(
+                self,
+                url,
+                headers,
+                data,
+                parse=text_stream.anthropic_deltas,
+                deadline=deadline,
+                events=text_stream.ANTHROPIC_EVENTS,
+                continue_with=continuation.anthropic,
+            )
+        )
 
-        result = response.json()
+    def _generate_text(
+        self,
+        api_key: str,
+        prompt: str,
+        document_url: str,
+        enable_web_search: bool,
+        max_tokens: int,
+        deadline: Deadline,
+    ) -> str | None:
+        """
+        Generate text using Claude Sonnet 4.5 API.
+        """
+        url, headers, data = self._build_request(api_key, prompt, document_url, enable_web_search, max_tokens)
+
+        def post(body: dict[str, Any]) -> dict[str, Any]:
+            response = http_pool.post(url, headers=headers, json=body, timeout=deadline.timeout())
+
+            if response.status_code != 200:
+                raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
 
+            return response.json()
+
+        # Answers cut off at max_tokens are continued with follow-up requests
+        return continuation.generate(
+            post,
+            data,
+            extract=self._extract_text,
+            stop_reason=lambda result: result.get("stop_reason"),
+            builder=continuation.anthropic,
+        )
+
+    def _extract_text(self, result: dict[str, Any]) -> str | None:
+        """
+        Extract the answer text from a Claude API response.
+        """
         # Extract text from Claude API response
         # Response format: {"content": [{"type": "text", "text": "..."}], ...}
         content_blocks = result.get("content", [])
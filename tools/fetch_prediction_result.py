@@ -0,0 +1,89 @@
+from collections.abc import Generator
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils import blob_stream, poll_schedule, predictions, progress, task_journal
+from utils.deadline import Deadline
+
+DEFAULT_DEADLINE = 420  # Same budget as the video tools
+POLL_SCHEDULE = poll_schedule.VIDEO
+
+VIDEO_EXTENSIONS = (".mp4", ".webm", ".mov")
+
+
+class FetchPredictionResultTool(Tool):
+    """
+    Tool for resuming or collecting an image or video task that was already
+    submitted by another GPTProto tool, using its prediction ID.
+    """
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """
+        Invoke the fetch prediction result tool.
+        """
+        # Get API key from credentials
+        api_key = self.runtime.credentials.get("api_key")
+        if not api_key:
+            yield self.create_text_message("Error: API key is required")
+            return
+
+        # Get parameters
+        prediction_id = tool_parameters.get("prediction_id", "").strip()
+        if not prediction_id:
+            yield self.create_text_message("Error: Prediction ID is required")
+            return
+
+        wait = tool_parameters.get("wait", True)
+        return_file = tool_parameters.get("return_file", False)
+
+        deadline = Deadline.from_parameters(tool_parameters, self.runtime.credentials, DEFAULT_DEADLINE)
+        journal = task_journal.TaskJournal(self.session.storage)
+        entry = journal.get(prediction_id) or {}
+        url_key = entry.get("url_key", "url")
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+        }
+
+        try:
+            done, output_url = predictions.check_result(
+                headers=headers,
+                result_id=prediction_id,
+                url_key=url_key,
+                deadline=deadline,
+            )
+            if done:
+                journal.update(prediction_id, task_journal.SUCCEEDED, output=output_url)
+            elif not wait:
+                yield self.create_text_message(f"Task is still running (ID: {prediction_id})")
+                return
+            else:
+                yield self.create_text_message(f"Task is still running, waiting for result... (ID: {prediction_id})")
+                updates = predictions.poll_result(
+                    headers=headers,
+                    result_id=prediction_id,
+                    deadline=deadline,
+                    url_key=url_key,
+                    schedule=POLL_SCHEDULE,
+                    journal=journal,
+                    # This tool exists to rescue a running task, so never cancel it
+                    cancel_on=frozenset(),
+                )
+                output_url = yield from progress.relay(self, updates)
+
+            if not output_url:
+                yield self.create_text_message("Error: Task completed without an output URL")
+            elif url_key == "video_url" or output_url.lower().split("?", 1)[0].endswith(VIDEO_EXTENSIONS):
+                yield self.create_json_message({"files": [{"url": output_url, "type": "video/mp4"}]})
+                if return_file:
+                    yield from blob_stream.attach_file(
+                        self, output_url, deadline, mime_type="video/mp4", filename=f"{prediction_id}.mp4"
+                    )
+                yield self.create_text_message(f"Video generated successfully!\n{output_url}")
+            else:
+                yield self.create_image_message(output_url)
+                yield self.create_text_message(f"Image generated successfully!\n{output_url}")
+
+        except Exception as e:
+            yield self.create_text_message(f"Error: {str(e)}")
@@ -1,12 +1,14 @@
 from collections.abc import Generator
 from typing import Any
 
-import requests
-
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils import continuation, http_pool, media_type, text_stream
+from utils.deadline import Deadline
+
 API_BASE = "https://gptproto.com/v1beta"
+DEFAULT_DEADLINE = 120
 
 
 class Gemini25FlashLiteTextGenerationTool(Tool):
@@ -32,13 +34,29 @@ class Gemini25FlashLiteTextGenerationTool(Tool):
             return
 
         file_url = tool_parameters.get("file_url", "")
+        stream = tool_parameters.get("stream", True)
+
+        deadline = Deadline.from_parameters(tool_parameters, self.runtime.credentials, DEFAULT_DEADLINE)
 
         try:
+            if stream:
+                # Stream text as it is generated
+                text = yield from self._stream_text(
+                    api_key=api_key,
+                    prompt=prompt,
+                    file_url=file_url,
+                    deadline=deadline,
+                )
+                if not text:
+                    yield self.create_text_message("Error: Failed to generate text")
+                return
+
             # Call API directly (no polling needed)
             result = self._generate_text(
                 api_key=api_key,
                 prompt=prompt,
                 file_url=file_url,
+                deadline=deadline,
             )
 
             if result:
@@ -49,38 +67,16 @@ class Gemini25FlashLiteTextGenerationTool(Tool):
         except Exception as e:
             yield self.create_text_message(f"Error: {str(e)}")
 
-    def _get_mime_type(self, url: str) -> str:
-        """
-        Determine MIME type from URL extension.
-        """
-        url_lower = url.lower()
-        if url_lower.endswith(".pdf"):
-            return "application/pdf"
-        elif url_lower.endswith(".doc"):
-            return "application/msword"
-        elif url_lower.endswith(".docx"):
-            return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        elif url_lower.endswith(".txt"):
-            return "text/plain"
-        elif url_lower.endswith(".png"):
-            return "image/png"
-        elif url_lower.endswith(".gif"):
-            return "image/gif"
-        elif url_lower.endswith(".webp"):
-            return "image/webp"
-        else:
-            return "application/pdf"  # Default for documents
-
-    def _generate_text(
+    def _build_request(
         self,
         api_key: str,
         prompt: str,
         file_url: str,
-    ) -> str | None:
+        deadline: Deadline,
+    ) -> tuple[dict[str, str], dict[str, Any]]:
         """
-        Generate text using Gemini 2.5 Flash Lite API.
+        Build the headers and body of a Gemini 2.5 Flash Lite request.
         """
-        url = f"{API_BASE}/models/gemini-2.5-flash-lite:generateContent"
         headers = {
             "Authorization": api_key,
             "Content-Type": "application/json",
@@ -89,9 +85,9 @@ class Gemini25FlashLiteTextGenerationTool(Tool):
         # Build parts array
         parts = [{"text": prompt}]
 
-        # Add file if provided (using file_data with URL)
+        # Add file if provided (using file_data with URL, type sniffed from its first bytes)
         if file_url:
-            mime_type = self._get_mime_type(file_url)
+            mime_type = media_type.probe(file_url, deadline, default="application/pdf")
             parts.append({
                 "file_data": {
                     "mime_type": mime_type,
@@ -108,20 +104,93 @@ class Gemini25FlashLiteTextGenerationTool(Tool):
             ]
         }
 
-        response = requests.post(url, headers=headers, json=data, timeout=120)
+        return headers, data
 
-        if response.status_code != 200:
-            raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
+    def _stream_text(
+        self,
+        api_key: str,
+        prompt: str,
+        file_url: str,
+        deadline: Deadline,
+    ) -> Generator[ToolInvokeMessage, None, str]:
+        """
+        Stream text from Gemini 2.5 Flash Lite, yielding every part as it arrives.
+        """
+        headers, data = self._build_request(
+            api_key=api_key,
+            prompt=prompt,
+            file_url=file_url,
+            deadline=deadline,
+        )
+        url = f"{API_BASE}/models/gemini-2.5-flash-lite:streamGenerateContent"
+
+        return (
+            yield from text_stream.stream_text(
+                self,
+                url,
+                headers,
+                data,
+                parse=text_stream.gemini_deltas,
+                deadline=deadline,
+                params={"alt": "sse"},
+                continue_with=continuation.gemini,
+            )
+        )
 
-        result = response.json()
+    def _generate_text(
+        self,
+        api_key: str,
+        prompt: str,
+        file_url: str,
+        deadline: Deadline,
+    ) -> str | None:
+        """
+        Generate text using Gemini 2.5 Flash Lite API.
+        """
+        headers, data = self._build_request(
+            api_key=api_key,
+            prompt=prompt,
+            file_url=file_url,
+            deadline=deadline,
+        )
+        url = f"{API_BASE}/models/gemini-2.5-flash-lite:generateContent"
 
+        def post(body: dict[str, Any]) -> dict[str, Any]:
+            response = http_pool.post(url, headers=headers, json=body, timeout=deadline.timeout())
+
+            if response.status_code != 200:
+                raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
+
+            return response.json()
+
+        # Answers cut off at maxOutputTokens are continued with follow-up requests
+        return continuation.generate(
+            post,
+            data,
+            extract=self._extract_text,
+            stop_reason=self._finish_reason,
+            builder=continuation.gemini,
+        )
+
+    def _extract_text(self, result: dict[str, Any]) -> str | None:
+        """
+        Extract the answer text from a Gemini API response.
+        """
         # Extract text from response
         # Response format: {"candidates": [{"content": {"parts": [{"text": "..."}]}}]}
         candidates = result.get("candidates", [])
         if candidates:
             content = candidates[0].get("content", {})
             parts = content.get("parts", [])
-            if parts:
-                return parts[0].get("text", "")
+            texts = [part["text"] for part in parts if part.get("text") and not part.get("thought")]
+            if texts:
+                return "".join(texts)
 
         return None
+
+    def _finish_reason(self, result: dict[str, Any]) -> str | None:
+        """
+        Read why the first candidate stopped ("MAX_TOKENS" when it hit the limit).
+        """
+        candidates = result.get("candidates") or [{}]
+        return candidates[0].get("finishReason")
@@ -1,13 +1,15 @@
-import base64
 from collections.abc import Generator
 from typing import Any
 
-import requests
-
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils import continuation, http_pool, inline_media, media_type, prefetch, text_stream
+from utils.deadline import Deadline
+
 API_BASE = "https://gptproto.com/v1beta"
+DEFAULT_DEADLINE = 150  # 30s image download + 120s generation
+IMAGE_MAX_EDGE = 3072  # Gemini scales larger images down to this anyway
 
 
 class GeminiTextGenerationTool(Tool):
@@ -37,8 +39,27 @@ class GeminiTextGenerationTool(Tool):
         video_url = tool_parameters.get("video_url", "")
         temperature = tool_parameters.get("temperature", 0.7)
         max_tokens = tool_parameters.get("max_tokens", 4096)
+        stream = tool_parameters.get("stream", True)
+
+        deadline = Deadline.from_parameters(tool_parameters, self.runtime.credentials, DEFAULT_DEADLINE)
 
         try:
+            if stream:
+                # Stream text as it is generated
+                text = yield from self._stream_text(
+                    api_key=api_key,
+                    prompt=prompt,
+                    image_url=image_url,
+                    file_url=file_url,
+                    video_url=video_url,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    deadline=deadline,
+                )
+                if not text:
+                    yield self.create_text_message("Error: Failed to generate text")
+                return
+
             # Call API directly (no polling needed)
             result = self._generate_text(
                 api_key=api_key,
@@ -48,6 +69,7 @@ class GeminiTextGenerationTool(Tool):
                 video_url=video_url,
                 temperature=temperature,
                 max_tokens=max_tokens,
+                deadline=deadline,
             )
 
             if result:
@@ -58,54 +80,7 @@ class GeminiTextGenerationTool(Tool):
         except Exception as e:
             yield self.create_text_message(f"Error: {str(e)}")
 
-    def _get_mime_type(self, url: str) -> str:
-        """
-        Determine MIME type from URL extension.
-        """
-        url_lower = url.lower()
-        # Image types
-        if url_lower.endswith(".png"):
-            return "image/png"
-        elif url_lower.endswith(".gif"):
-            return "image/gif"
-        elif url_lower.endswith(".webp"):
-            return "image/webp"
-        # Video types
-        elif url_lower.endswith(".mp4"):
-            return "video/mp4"
-        elif url_lower.endswith(".webm"):
-            return "video/webm"
-        elif url_lower.endswith(".mov"):
-            return "video/quicktime"
-        elif url_lower.endswith(".avi"):
-            return "video/x-msvideo"
-        elif url_lower.endswith(".mkv"):
-            return "video/x-matroska"
-        # Document types
-        elif url_lower.endswith(".pdf"):
-            return "application/pdf"
-        elif url_lower.endswith(".doc"):
-            return "application/msword"
-        elif url_lower.endswith(".docx"):
-            return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        elif url_lower.endswith(".txt"):
-            return "text/plain"
-        else:
-            return "image/jpeg"  # Default for images
-
-    def _download_and_encode_image(self, url: str) -> str | None:
-        """
-        Download image from URL and encode to base64.
-        """
-        try:
-            response = requests.get(url, timeout=30)
-            if response.status_code == 200:
-                return base64.b64encode(response.content).decode("utf-8")
-        except Exception:
-            pass
-        return None
-
-    def _generate_text(
+    def _build_request(
         self,
         api_key: str,
         prompt: str,
@@ -114,47 +89,55 @@ class GeminiTextGenerationTool(Tool):
         video_url: str,
         temperature: float,
         max_tokens: int,
-    ) -> str | None:
+        deadline: Deadline,
+    ) -> tuple[dict[str, str], dict[str, Any]]:
         """
-        Generate text using Gemini 3 Pro API.
+        Build the headers and body of a Gemini 3 Pro request.
         """
-        url = f"{API_BASE}/models/gemini-3-pro-preview:generateContent"
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
         }
 
+        # Fetch the image and probe the file and video at the same time,
+        # so the wait is the slowest of them rather than their sum
+        calls = {}
+        if image_url:
+            calls["image"] = lambda: inline_media.fetch(image_url, deadline, max_edge=IMAGE_MAX_EDGE)
+        if file_url:
+            calls["file"] = lambda: media_type.probe(file_url, deadline, default="image/jpeg")
+        if video_url:
+            calls["video"] = lambda: media_type.probe(
+                video_url, deadline, allowed=media_type.VIDEO_TYPES, default="video/mp4"
+            )
+        media = prefetch.gather(calls, deadline)
+
         # Build parts array
         parts = [{"text": prompt}]
 
-        # Add image if provided (using inlineData with base64)
+        # Add image if provided (using inlineData with base64, encoded while downloading)
         if image_url:
-            image_data = self._download_and_encode_image(image_url)
-            if image_data:
-                mime_type = self._get_mime_type(image_url)
-                parts.append({
-                    "inlineData": {
-                        "mimeType": mime_type,
-                        "data": image_data
-                    }
-                })
-
-        # Add file if provided (using fileData with URL)
+            parts.append({
+                "inlineData": {
+                    "mimeType": media["image"].mime_type,
+                    "data": media["image"]
+                }
+            })
+
+        # Add file if provided (using fileData with URL, type sniffed from its first bytes)
         if file_url:
-            mime_type = self._get_mime_type(file_url)
             parts.append({
                 "fileData": {
-                    "mimeType": mime_type,
+                    "mimeType": media["file"],
                     "fileUri": file_url
                 }
             })
 
-        # Add video if provided (using fileData with URL)
+        # Add video if provided (using fileData with URL, type sniffed from its first bytes)
         if video_url:
-            mime_type = self._get_mime_type(video_url)
             parts.append({
                 "fileData": {
-                    "mimeType": mime_type,
+                    "mimeType": media["video"],
                     "fileUri": video_url
                 }
             })
@@ -192,20 +175,114 @@ class GeminiTextGenerationTool(Tool):
             ]
         }
 
-        response = requests.post(url, headers=headers, json=data, timeout=120)
+        return headers, data
+
+    def _stream_text(
+        self,
+        api_key: str,
+        prompt: str,
+        image_url: str,
+        file_url: str,
+        video_url: str,
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline,
+    ) -> Generator[ToolInvokeMessage, None, str]:
+        """
+        Stream text from Gemini 3 Pro, yielding every part as it arrives.
+        """
+        headers, data = self._build_request(
+            api_key=api_key,
+            prompt=prompt,
+            image_url=image_url,
+            file_url=file_url,
+            video_url=video_url,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            deadline=deadline,
+        )
+        url = f"{API_BASE}/models/gemini-3-pro-preview:streamGenerateContent"
+
+        return (
+            yield from text_stream.stream_text(
+                self,
+                url,
+                headers,
+                data,
+                parse=text_stream.gemini_deltas,
+                deadline=deadline,
+                params={"alt": "sse"},
+                continue_with=continuation.gemini,
+            )
+        )
+
+    def _generate_text(
+        self,
+        api_key: str,
+        prompt: str,
+        image_url: str,
+        file_url: str,
+        video_url: str,
+        temperature: float,
+        max_tokens: int,
+        deadline: Deadline,
+    ) -> str | None:
+        """
+        Generate text using Gemini 3 Pro API.
+        """
+        headers, data = self._build_request(
+            api_key=api_key,
+            prompt=prompt,
+            image_url=image_url,
+            file_url=file_url,
+            video_url=video_url,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            deadline=deadline,
+        )
+        url = f"{API_BASE}/models/gemini-3-pro-preview:generateContent"
+
+        def post(body: dict[str, Any]) -> dict[str, Any]:
+            response = http_pool.post(
+                url,
+                headers=headers,
+                timeout=deadline.timeout(),
+                **inline_media.body_kwargs(body),
+            )
+
+            if response.status_code != 200:
+                raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
 
-        if response.status_code != 200:
-            raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
+            return response.json()
 
-        result = response.json()
+        # Answers cut off at maxOutputTokens are continued with follow-up requests
+        return continuation.generate(
+            post,
+            data,
+            extract=self._extract_text,
+            stop_reason=self._finish_reason,
+            builder=continuation.gemini,
+        )
 
+    def _extract_text(self, result: dict[str, Any]) -> str | None:
+        """
+        Extract the answer text from a Gemini API response.
+        """
         # Extract text from response
         # Response format: {"candidates": [{"content": {"parts": [{"text": "..."}]}}]}
         candidates = result.get("candidates", [])
         if candidates:
             content = candidates[0].get("content", {})
             parts = content.get("parts", [])
-            if parts:
-                return parts[0].get("text", "")
+            texts = [part["text"] for part in parts if part.get("text") and not part.get("thought")]
+            if texts:
+                return "".join(texts)
 
         return None
+
+    def _finish_reason(self, result: dict[str, Any]) -> str | None:
+        """
+        Read why the first candidate stopped ("MAX_TOKENS" when it hit the limit).
+        """
+        candidates = result.get("candidates") or [{}]
+        return candidates[0].get("finishReason")
@@ -1,13 +1,16 @@
-import time
 from collections.abc import Generator
 from typing import Any
 
-import requests
-
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils import completion_stats, http_pool, poll_schedule, predictions, progress, task_journal, webhook
+from utils.deadline import Deadline
+
 API_BASE = "https://gptproto.com/api/v3"
+ENDPOINT = "google/gemini-3-pro-image-preview/text-to-image"
+DEFAULT_DEADLINE = 150  # 30s submit + 2 minutes of polling
+POLL_SCHEDULE = poll_schedule.IMAGE
 
 
 class GeminiTextToImageTool(Tool):
@@ -35,6 +38,9 @@ class GeminiTextToImageTool(Tool):
         aspect_ratio = tool_parameters.get("aspect_ratio", "1:1")
         output_format = tool_parameters.get("output_format", "png")
 
+        deadline = Deadline.from_parameters(tool_parameters, self.runtime.credentials, DEFAULT_DEADLINE)
+        bucket = completion_stats.bucket_key(ENDPOINT, size=size)
+
         try:
             # Submit task
             result_id = self._submit_task(
@@ -43,22 +49,27 @@ class GeminiTextToImageTool(Tool):
                 size=size,
                 aspect_ratio=aspect_ratio,
                 output_format=output_format,
+                deadline=deadline,
             )
 
             if not result_id:
                 yield self.create_text_message("Error: Failed to submit image generation task")
                 return
 
+            task_journal.TaskJournal(self.session.storage).record_submit(
+                result_id, endpoint=ENDPOINT, url_key="image_url", parameters=tool_parameters
+            )
+
             yield self.create_text_message(f"Task submitted, waiting for result... (ID: {result_id})")
 
             # Poll for result
-            image_url = self._poll_result(api_key=api_key, result_id=result_id)
+            image_url = yield from self._poll_result(api_key=api_key, result_id=result_id, deadline=deadline, bucket=bucket)
 
             if image_url:
                 yield self.create_image_message(image_url)
                 yield self.create_text_message(f"Image generated successfully!\n{image_url}")
             else:
-                yield self.create_text_message("Error: Failed to get image result after timeout")
+                yield self.create_text_message("Error: Failed to get image result")
 
         except Exception as e:
             yield self.create_text_message(f"Error: {str(e)}")
@@ -70,11 +81,12 @@ class GeminiTextToImageTool(Tool):
         size: str,
         aspect_ratio: str,
         output_format: str,
+        deadline: Deadline,
     ) -> str | None:
         """
         Submit image generation task.
         """
-        url = f"{API_BASE}/google/gemini-3-pro-image-preview/text-to-image"
+        url = f"{API_BASE}/{ENDPOINT}"
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
@@ -86,7 +98,13 @@ class GeminiTextToImageTool(Tool):
             "output_format": output_format,
         }
 
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response = http_pool.post(
+            url,
+            headers=headers,
+            params=webhook.submit_params(),
+            json=data,
+            timeout=deadline.timeout(30),
+        )
 
         if response.status_code != 200:
             raise Exception(f"Failed to submit task: HTTP {response.status_code} - {response.text}")
@@ -106,60 +124,23 @@ class GeminiTextToImageTool(Tool):
         self,
         api_key: str,
         result_id: str,
-        max_attempts: int = 60,
-        poll_interval: int = 2,
-    ) -> str | None:
+        deadline: Deadline,
+        bucket: str,
+    ) -> Generator[ToolInvokeMessage, None, str | None]:
         """
-        Poll for task result.
+        Poll for task result, streaming progress messages while waiting.
         """
-        url = f"{API_BASE}/predictions/{result_id}/result"
         headers = {
             "Authorization": f"Bearer {api_key}",
         }
-
-        for _ in range(max_attempts):
-            try:
-                response = requests.get(url, headers=headers, timeout=30)
-
-                if response.status_code == 200:
-                    result = response.json()
-
-                    # Handle wrapped response: {"data": {...}, "code": 200}
-                    data = result.get("data", result)
-
-                    # Check if task is completed
-                    status = data.get("status", "").lower()
-
-                    if status in ("succeeded", "completed", "success"):
-                        # Try to extract image URL from "outputs" array first
-                        outputs = data.get("outputs")
-                        if isinstance(outputs, list) and len(outputs) > 0:
-                            return outputs[0]
-
-                        # Fallback to "output" field
-                        output = data.get("output")
-                        if isinstance(output, list) and len(output) > 0:
-                            return output[0]
-                        elif isinstance(output, str):
-                            return output
-
-                        # Try other common fields
-                        return (
-                            data.get("image_url")
-                            or data.get("url")
-                            or data.get("result")
-                        )
-
-                    elif status in ("failed", "error"):
-                        error_msg = data.get("error") or result.get("message") or "Unknown error"
-                        raise Exception(f"Task failed: {error_msg}")
-
-                    # Still processing, continue polling
-
-            except requests.exceptions.RequestException:
-                # Network error, continue trying
-                pass
-
-            time.sleep(poll_interval)
-
-        return None
+        updates = predictions.poll_result(
+            headers=headers,
+            result_id=result_id,
+            deadline=deadline,
+            url_key="image_url",
+            schedule=POLL_SCHEDULE,
+            stats=completion_stats.CompletionStats(self.session.storage),
+            bucket=bucket,
+            journal=task_journal.TaskJournal(self.session.storage),
+        )
+        return (yield from progress.relay(self, updates))
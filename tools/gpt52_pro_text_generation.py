@@ -1,12 +1,16 @@
 from collections.abc import Generator
 from typing import Any
 
-import requests
-
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils import http_pool, text_stream
+from utils.deadline import Deadline
+
 API_BASE = "https://gptproto.com/v1"
+DEFAULT_DEADLINE = 600  # Pro runs can take several minutes
+# Reasoning can go minutes without sending an event before the answer starts
+STREAM_IDLE_TIMEOUT = 240
 
 
 class Gpt52ProTextGenerationTool(Tool):
@@ -34,8 +38,25 @@ class Gpt52ProTextGenerationTool(Tool):
         image_url = tool_parameters.get("image_url", "")
         file_url = tool_parameters.get("file_url", "")
         enable_web_search = tool_parameters.get("enable_web_search", False)
+        stream = tool_parameters.get("stream", True)
+
+        deadline = Deadline.from_parameters(tool_parameters, self.runtime.credentials, DEFAULT_DEADLINE)
 
         try:
+            if stream:
+                # Stream text as it is generated
+                text = yield from self._stream_text(
+                    api_key=api_key,
+                    prompt=prompt,
+                    image_url=image_url,
+                    file_url=file_url,
+                    enable_web_search=enable_web_search,
+                    deadline=deadline,
+                )
+                if not text:
+                    yield self.create_text_message("Error: Failed to generate text")
+                return
+
             # Call API directly
             result = self._generate_text(
                 api_key=api_key,
@@ -43,6 +64,7 @@ class Gpt52ProTextGenerationTool(Tool):
                 image_url=image_url,
                 file_url=file_url,
                 enable_web_search=enable_web_search,
+                deadline=deadline,
             )
 
             if result:
@@ -53,16 +75,16 @@ class Gpt52ProTextGenerationTool(Tool):
         except Exception as e:
             yield self.create_text_message(f"Error: {str(e)}")
 
-    def _generate_text(
+    def _build_request(
         self,
         api_key: str,
         prompt: str,
         image_url: str,
         file_url: str,
         enable_web_search: bool,
-    ) -> str | None:
+    ) -> tuple[str, dict[str, str], dict[str, Any]]:
         """
-        Generate text using GPT-5.2-Pro API.
+        Build the URL, headers and body of a GPT-5.2-Pro responses request.
         """
         url = f"{API_BASE}/responses"
         headers = {
@@ -111,7 +133,51 @@ class Gpt52ProTextGenerationTool(Tool):
                 }
             ]
 
-        response = requests.post(url, headers=headers, json=data, timeout=120)
+        return url, headers, data
+
+    def _stream_text(
+        self,
+        api_key: str,
+        prompt: str,
+        image_url: str,
+        file_url: str,
+        enable_web_search: bool,
+        deadline: Deadline,
+    ) -> Generator[ToolInvokeMessage, None, str]:
+        """
+        Stream text from GPT-5.2-Pro, yielding deltas as they arrive.
+        """
+        url, headers, data = self._build_request(api_key, prompt, image_url, file_url, enable_web_search)
+        data["stream"] = True
+
+        return (
+            yield from text_stream.stream_text(
+                self,
+                url,
+                headers,
+                data,
+                parse=text_stream.openai_responses_deltas,
+                deadline=deadline,
+                events=text_stream.OPENAI_RESPONSES_EVENTS,
+                idle_timeout=STREAM_IDLE_TIMEOUT,
+            )
+        )
+
+    def _generate_text(
+        self,
+        api_key: str,
+        prompt: str,
+        image_url: str,
+        file_url: str,
+        enable_web_search: bool,
+        deadline: Deadline,
+    ) -> str | None:
+        """
+        Generate text using GPT-5.2-Pro API.
+        """
+        url, headers, data = self._build_request(api_key, prompt, image_url, file_url, enable_web_search)
+
+        response = http_pool.post(url, headers=headers, json=data, timeout=deadline.timeout())
 
         if response.status_code != 200:
             raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
@@ -1,13 +1,16 @@
-import time
 from collections.abc import Generator
 from typing import Any
 
-import requests
-
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils import blob_stream, completion_stats, http_pool, poll_schedule, predictions, progress, task_journal, webhook
+from utils.deadline import Deadline
+
 API_BASE = "https://gptproto.com/api/v3"
+ENDPOINT = "minimax/hailuo-2.3-standard/image-to-video"
+DEFAULT_DEADLINE = 420  # 60s submit + 6 minutes of polling
+POLL_SCHEDULE = poll_schedule.VIDEO
 
 
 class Hailuo23StandardImageToVideoTool(Tool):
@@ -37,6 +40,10 @@ class Hailuo23StandardImageToVideoTool(Tool):
             return
 
         duration = int(tool_parameters.get("duration", "6"))
+        return_file = tool_parameters.get("return_file", False)
+
+        deadline = Deadline.from_parameters(tool_parameters, self.runtime.credentials, DEFAULT_DEADLINE)
+        bucket = completion_stats.bucket_key(ENDPOINT, duration=duration)
 
         try:
             # Submit task
@@ -45,22 +52,31 @@ class Hailuo23StandardImageToVideoTool(Tool):
                 prompt=prompt,
                 image=image,
                 duration=duration,
+                deadline=deadline,
             )
 
             if not result_id:
                 yield self.create_text_message("Error: Failed to submit video generation task")
                 return
 
+            task_journal.TaskJournal(self.session.storage).record_submit(
+                result_id, endpoint=ENDPOINT, url_key="video_url", parameters=tool_parameters
+            )
+
             yield self.create_text_message(f"Task submitted, generating video... (ID: {result_id})")
 
             # Poll for result (longer timeout for video)
-            video_url = self._poll_result(api_key=api_key, result_id=result_id)
+            video_url = yield from self._poll_result(api_key=api_key, result_id=result_id, deadline=deadline, bucket=bucket)
 
             if video_url:
                 yield self.create_json_message({"files": [{"url": video_url, "type": "video/mp4"}]})
+                if return_file:
+                    yield from blob_stream.attach_file(
+                        self, video_url, deadline, mime_type="video/mp4", filename=f"{result_id}.mp4"
+                    )
                 yield self.create_text_message(f"Video generated successfully!\n{video_url}")
             else:
-                yield self.create_text_message("Error: Failed to get video result after timeout")
+                yield self.create_text_message("Error: Failed to get video result")
 
         except Exception as e:
             yield self.create_text_message(f"Error: {str(e)}")
@@ -71,11 +87,12 @@ class Hailuo23StandardImageToVideoTool(Tool):
         prompt: str,
         image: str,
         duration: int,
+        deadline: Deadline,
     ) -> str | None:
         """
         Submit image-to-video task.
         """
-        url = f"{API_BASE}/minimax/hailuo-2.3-standard/image-to-video"
+        url = f"{API_BASE}/{ENDPOINT}"
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
@@ -87,7 +104,13 @@ class Hailuo23StandardImageToVideoTool(Tool):
             "duration": duration,
         }
 
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        response = http_pool.post(
+            url,
+            headers=headers,
+            params=webhook.submit_params(),
+            json=data,
+            timeout=deadline.timeout(60),
+        )
 
         if response.status_code != 200:
             raise Exception(f"Failed to submit task: HTTP {response.status_code} - {response.text}")
@@ -107,55 +130,23 @@ class Hailuo23StandardImageToVideoTool(Tool):
         self,
         api_key: str,
         result_id: str,
-        max_attempts: int = 180,  # 6 minutes for video
-        poll_interval: int = 2,
-    ) -> str | None:
+        deadline: Deadline,
+        bucket: str,
+    ) -> Generator[ToolInvokeMessage, None, str | None]:
         """
-        Poll for task result.
+        Poll for task result, streaming progress messages while waiting.
         """
-        url = f"{API_BASE}/predictions/{result_id}/result"
         headers = {
             "Authorization": f"Bearer {api_key}",
         }
-
-        for _ in range(max_attempts):
-            try:
-                response = requests.get(url, headers=headers, timeout=30)
-
-                if response.status_code == 200:
-                    result = response.json()
-
-                    # Handle wrapped response
-                    data = result.get("data", result)
-
-                    # Check if task is completed
-                    status = data.get("status", "").lower()
-
-                    if status in ("succeeded", "completed", "success"):
-                        # Try to extract video URL
-                        outputs = data.get("outputs")
-                        if isinstance(outputs, list) and len(outputs) > 0:
-                            return outputs[0]
-
-                        output = data.get("output")
-                        if isinstance(output, list) and len(output) > 0:
-                            return output[0]
-                        elif isinstance(output, str):
-                            return output
-
-                        return (
-                            data.get("video_url")
-                            or data.get("url")
-                            or data.get("result")
-                        )
-
-                    elif status in ("failed", "error"):
-                        error_msg = data.get("error") or result.get("message") or "Unknown error"
-                        raise Exception(f"Task failed: {error_msg}")
-
-            except requests.exceptions.RequestException:
-                pass
-
-            time.sleep(poll_interval)
-
-        return None
+        updates = predictions.poll_result(
+            headers=headers,
+            result_id=result_id,
+            deadline=deadline,
+            url_key="video_url",
+            schedule=POLL_SCHEDULE,
+            stats=completion_stats.CompletionStats(self.session.storage),
+            bucket=bucket,
+            journal=task_journal.TaskJournal(self.session.storage),
+        )
+        return (yield from progress.relay(self, updates))
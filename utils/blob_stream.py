@@ -0,0 +1,116 @@
+"""
+Streaming of generated files into Dify as blobs.
+
+The video tools normally return only the output URL, which expires. With
+``return_file`` they also hand Dify the file itself. ``create_blob_message``
+would need the whole file in memory (and the plugin runtime copies it again
+while splitting it), so ``stream_file`` instead reads the file in
+fixed-size chunks and yields each one as a ``blob_chunk`` message, the same
+wire format the runtime uses for blobs. Only one chunk is held at a time, so
+peak memory stays the same whatever the file size.
+
+The file is first downloaded to a temporary file on disk with
+``utils.download`` (parallel ranges, resumed on dropped connections, length
+verified), since Dify needs the total length up front and a download that
+fails halfway should not leave it a partial file.
+"""
+
+import logging
+import os
+import posixpath
+import tempfile
+import uuid
+from collections.abc import Generator
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils import download
+from utils.deadline import Deadline
+
+if TYPE_CHECKING:
+    from dify_plugin import Tool
+
+logger = logging.getLogger(__name__)
+
+# Same chunk size the plugin runtime uses when it splits blob messages
+CHUNK_SIZE = 8192
+
+
+def filename_from_url(url: str, default: str) -> str:
+    """
+    Last path segment of ``url``, or ``default`` if it has no extension.
+    """
+    name = posixpath.basename(urlparse(url).path)
+    return name if os.path.splitext(name)[1] else default
+
+
+def _chunk_message(
+    blob_id: str,
+    sequence: int,
+    total_length: int,
+    blob: bytes,
+    end: bool,
+    meta: dict,
+) -> ToolInvokeMessage:
+    return ToolInvokeMessage(
+        type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+        message=ToolInvokeMessage.BlobChunkMessage(
+            id=blob_id,
+            sequence=sequence,
+            total_length=total_length,
+            blob=blob,
+            end=end,
+        ),
+        meta=meta,
+    )
+
+
+def stream_file(
+    url: str,
+    deadline: Deadline,
+    mime_type: str,
+    filename: str | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Generator[ToolInvokeMessage, None, int]:
+    """
+    Download ``url`` and yield it to Dify as blob chunks; return its size.
+
+    Raises if the download fails or its length does not verify; nothing is
+    sent to Dify then.
+    """
+    meta = {"mime_type": mime_type, "filename": filename or filename_from_url(url, "output")}
+    with tempfile.TemporaryFile() as spool:
+        length = download.download(url, spool, deadline)
+        spool.seek(0)
+
+        blob_id = uuid.uuid4().hex
+        sequence = 0
+        for chunk in iter(lambda: spool.read(chunk_size), b""):
+            yield _chunk_message(blob_id, sequence, length, chunk, False, meta)
+            sequence += 1
+        yield _chunk_message(blob_id, sequence, length, b"", True, meta)
+
+    logger.info("Streamed %s (%d bytes) to Dify in %d chunks", meta["filename"], length, sequence)
+    return length
+
+
+def attach_file(
+    tool: "Tool",
+    url: str,
+    deadline: Deadline,
+    mime_type: str,
+    filename: str | None = None,
+) -> Generator[ToolInvokeMessage, None, bool]:
+    """
+    ``stream_file`` for tools whose result URL is already delivered: a failed
+    download is reported as a text message instead of failing the call.
+    """
+    try:
+        yield from stream_file(url, deadline, mime_type, filename)
+        return True
+    except Exception as e:
+        logger.warning("Could not attach %s: %s", url, e)
+        yield tool.create_text_message(f"Could not attach the file, use the URL instead: {str(e)}")
+        return False
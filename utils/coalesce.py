@@ -0,0 +1,106 @@
+"""
+Coalescing of streamed text deltas into fewer, larger messages.
+
+Streaming endpoints send deltas of a few characters each, and every tool
+message sent to the Dify daemon has a fixed cost. ``coalesce`` buffers
+deltas and flushes them as one chunk when the buffer reaches
+``GPTPROTO_STREAM_FLUSH_CHARS`` characters (default 120), when the oldest
+buffered text has waited ``GPTPROTO_STREAM_FLUSH_INTERVAL`` seconds (default
+0.25), or when a delta ends a sentence or line. The first delta is always
+flushed immediately so time to first token is not delayed. Set the size to
+``0`` to pass every delta through unchanged.
+
+The deltas are read on a separate thread and handed over through a queue,
+so the interval also applies while the stream is quiet: text buffered
+before a web search or reasoning pause is sent when the interval runs
+out, not when the next delta arrives.
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+FLUSH_CHARS = int(os.environ.get("GPTPROTO_STREAM_FLUSH_CHARS", "120"))
+FLUSH_INTERVAL = float(os.environ.get("GPTPROTO_STREAM_FLUSH_INTERVAL", "0.25"))
+
+# Sentence or line end, allowing closing quotes/brackets and trailing spaces
+_BOUNDARY = re.compile(r"[.!?;:\n。！？；：…][\"'”’)\]）」』]*\s*$")
+# Put on the queue by the reader thread when the deltas are exhausted
+_END = object()
+
+
+def _pump(deltas: Iterable[str], items: "queue.Queue[tuple[Any, BaseException | None]]", stop: threading.Event) -> None:
+    # Runs on the reader thread; the consumer stops reading by setting ``stop``
+    try:
+        for delta in deltas:
+            if stop.is_set():
+                return
+            if delta:
+                items.put((delta, None))
+        items.put((_END, None))
+    except BaseException as e:
+        items.put((None, e))
+
+
+def coalesce(
+    deltas: Iterable[str],
+    max_chars: int = FLUSH_CHARS,
+    max_delay: float = FLUSH_INTERVAL,
+    clock: Callable[[], float] = time.monotonic,
+) -> Iterator[str]:
+    """
+    Yield ``deltas`` joined into chunks, flushing on size, age or a sentence end.
+
+    Buffered text is flushed once it is ``max_delay`` seconds old even if no
+    further delta arrives. Errors raised by ``deltas`` are re-raised here
+    after the text that arrived before them.
+    """
+    if max_chars <= 0 or max_delay <= 0:
+        yield from (delta for delta in deltas if delta)
+        return
+
+    items: queue.Queue[tuple[Any, BaseException | None]] = queue.Queue()
+    stop = threading.Event()
+    reader = threading.Thread(target=_pump, args=(deltas, items, stop), name="gptproto-coalesce", daemon=True)
+    reader.start()
+
+    buffer: list[str] = []
+    size = 0
+    first_at = 0.0
+    flushed_any = False
+    try:
+        while True:
+            timeout = max(max_delay - (clock() - first_at), 0) if buffer else None
+            try:
+                delta, error = items.get(timeout=timeout)
+            except queue.Empty:
+                # The stream is quiet and the oldest text has waited long enough
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                continue
+            if error is not None:
+                # Deliver what arrived before the stream failed, then fail
+                if buffer:
+                    yield "".join(buffer)
+                raise error
+            if delta is _END:
+                break
+            if not buffer:
+                first_at = clock()
+            buffer.append(delta)
+            size += len(delta)
+            if not flushed_any or size >= max_chars or _BOUNDARY.search(delta):
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                flushed_any = True
+    finally:
+        stop.set()
+
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,113 @@
+"""
+Observed completion times of prediction tasks, used to time the first poll.
+
+Durations are grouped into buckets by endpoint and the parameters that
+drive render time (duration, resolution, size). Recent samples are kept in
+memory and persisted in plugin storage so the priors survive restarts.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import asdict
+from typing import Any
+
+from utils.poll_schedule import PollSchedule, PriorPollSchedule
+
+logger = logging.getLogger(__name__)
+
+# Samples needed before a bucket's percentiles are trusted
+MIN_SAMPLES = 5
+# Most recent samples kept per bucket
+MAX_SAMPLES = 50
+
+_lock = threading.Lock()
+_cache: dict[str, list[float]] = {}
+
+
+def bucket_key(endpoint: str, **params: Any) -> str:
+    """
+    Build a bucket key such as ``openai/reverse/sora-2/text-to-video|duration=20|size=large``.
+    """
+    parts = [endpoint] + [f"{name}={params[name]}" for name in sorted(params)]
+    return "|".join(parts)
+
+
+def _storage_key(bucket: str) -> str:
+    return "completion_stats_" + hashlib.sha256(bucket.encode("utf-8")).hexdigest()[:32]
+
+
+def _percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(int(fraction * len(ordered)), len(ordered) - 1)
+    return ordered[index]
+
+
+class CompletionStats:
+    """
+    Completion-time samples per bucket, backed by plugin storage.
+
+    Storage failures are logged and ignored: without priors the tools fall
+    back to their static poll schedule.
+    """
+
+    def __init__(self, storage: Any):
+        self.storage = storage
+
+    def _load(self, bucket: str) -> list[float]:
+        try:
+            key = _storage_key(bucket)
+            if self.storage.exist(key):
+                samples = json.loads(self.storage.get(key).decode("utf-8"))
+                return [float(s) for s in samples][-MAX_SAMPLES:]
+        except Exception as e:
+            logger.debug("Could not load completion stats for %s: %s", bucket, e)
+        return []
+
+    def _save(self, bucket: str, samples: list[float]) -> None:
+        try:
+            payload = json.dumps([round(s, 2) for s in samples]).encode("utf-8")
+            self.storage.set(_storage_key(bucket), payload)
+        except Exception as e:
+            logger.debug("Could not save completion stats for %s: %s", bucket, e)
+
+    def samples(self, bucket: str) -> list[float]:
+        with _lock:
+            cached = _cache.get(bucket)
+        if cached is None:
+            cached = self._load(bucket)
+            with _lock:
+                cached = _cache.setdefault(bucket, cached)
+        return list(cached)
+
+    def percentiles(self, bucket: str) -> tuple[float, float] | None:
+        """
+        Return ``(p50, p90)`` in seconds, or None with too few samples.
+        """
+        samples = self.samples(bucket)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return _percentile(samples, 0.5), _percentile(samples, 0.9)
+
+    def record(self, bucket: str, seconds: float) -> None:
+        # Reload before appending so samples written by other plugin
+        # processes are merged rather than overwritten.
+        stored = self._load(bucket)
+        with _lock:
+            samples = stored or _cache.get(bucket, [])
+            samples = (samples + [seconds])[-MAX_SAMPLES:]
+            _cache[bucket] = samples
+        self._save(bucket, samples)
+
+    def schedule_for(self, bucket: str, base: PollSchedule) -> PollSchedule:
+        """
+        Return a schedule timed by the bucket's priors, or ``base`` without them.
+        """
+        priors = self.percentiles(bucket)
+        if priors is None:
+            return base
+        p50, p90 = priors
+        params = asdict(base)
+        params["fast_polls"] = 0
+        return PriorPollSchedule(**params, p50=p50, p90=p90)
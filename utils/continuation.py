@@ -0,0 +1,112 @@
+"""
+Automatic continuation of answers cut off by the output token limit.
+
+When a model stops because it reached ``max_tokens`` (Anthropic
+``stop_reason: max_tokens``, OpenAI ``finish_reason: length``, Gemini
+``finishReason: MAX_TOKENS``), the text tools send a follow-up request that
+carries the partial answer and join the continuation onto it, up to
+``GPTPROTO_MAX_CONTINUATIONS`` times (default 3, ``0`` disables it).
+
+Claude continues from a prefilled assistant turn, so the answer resumes
+mid-sentence. The prefill cannot end in whitespace, so the continuation is
+joined onto the answer with its trailing whitespace trimmed (``joined``);
+the continuation brings its own. Gemini has no prefill; the partial answer
+is sent as the model's turn followed by a short instruction to carry on
+from its last word.
+
+``text_stream.stream_text`` uses the builders here for streaming requests;
+``generate`` is the same loop for blocking requests.
+"""
+
+import logging
+import os
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+MAX_CONTINUATIONS = int(os.environ.get("GPTPROTO_MAX_CONTINUATIONS", "3"))
+
+# Stop reasons meaning the output token limit was hit: Anthropic, OpenAI, Gemini
+TRUNCATED_STOP_REASONS = frozenset({"max_tokens", "length", "MAX_TOKENS"})
+
+CONTINUE_PROMPT = "Continue exactly where you stopped, without repeating or summarising what you already wrote."
+
+Builder = Callable[[dict[str, Any], str], dict[str, Any]]
+
+
+def is_truncated(stop_reason: str | None) -> bool:
+    """
+    Whether a stop reason means the output hit the token limit.
+    """
+    return stop_reason in TRUNCATED_STOP_REASONS
+
+
+def anthropic(data: dict[str, Any], text: str) -> dict[str, Any]:
+    """
+    Request body that continues ``text`` from a prefilled assistant turn.
+    """
+    # The API rejects a prefill that ends in whitespace
+    return {**data, "messages": [*data["messages"], {"role": "assistant", "content": text.rstrip()}]}
+
+
+# Claude behind chat completions accepts the same trailing assistant turn
+openai_chat = anthropic
+
+
+def joined(builder: Builder, text: str) -> str:
+    """
+    The answer so far as a continuation built by ``builder`` follows on from it.
+
+    With a prefill it is ``text`` without its trailing whitespace, which the
+    continuation starts with again; with Gemini it is ``text`` unchanged.
+    """
+    return text.rstrip() if builder is anthropic else text
+
+
+def gemini(data: dict[str, Any], text: str) -> dict[str, Any]:
+    """
+    Request body that asks Gemini to continue ``text``.
+    """
+    return {
+        **data,
+        "contents": [
+            *data["contents"],
+            {"role": "model", "parts": [{"text": text}]},
+            {"role": "user", "parts": [{"text": CONTINUE_PROMPT}]},
+        ],
+    }
+
+
+def generate(
+    post: Callable[[dict[str, Any]], dict[str, Any]],
+    data: dict[str, Any],
+    extract: Callable[[dict[str, Any]], str | None],
+    stop_reason: Callable[[dict[str, Any]], str | None],
+    builder: Builder,
+) -> str | None:
+    """
+    Run a blocking request and continue its answer while it is truncated.
+
+    ``post`` sends a request body and returns the decoded response,
+    ``extract`` and ``stop_reason`` read the text and stop reason from it and
+    ``builder`` makes the next body from the original one and the text so
+    far. Returns the joined text, or None if the first response had none.
+    """
+    text = ""
+    body = data
+    for continued in range(MAX_CONTINUATIONS + 1):
+        result = post(body)
+        more = extract(result)
+        if not more:
+            break
+        text += more
+        if not is_truncated(stop_reason(result)):
+            break
+        if continued == MAX_CONTINUATIONS:
+            logger.warning("Output still truncated after %d continuations", MAX_CONTINUATIONS)
+            break
+        logger.info("Output hit the token limit; continuing (%d/%d)", continued + 1, MAX_CONTINUATIONS)
+        text = joined(builder, text)
+        body = builder(data, text)
+    return text or None
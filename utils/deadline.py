@@ -0,0 +1,84 @@
+"""
+Per-invocation time budget shared by every network step of a tool call.
+
+A tool builds one ``Deadline`` at the start of ``_invoke`` and hands it to
+its submit, poll and download steps. Each step asks the deadline for its
+timeout, so the whole invocation finishes (or fails with
+``DeadlineExceededError``) within the budget instead of summing hard-coded
+per-call timeouts.
+"""
+
+import time
+from collections.abc import Mapping
+from typing import Any
+
+
+class DeadlineExceededError(TimeoutError):
+    """
+    Raised when an invocation has used up its time budget.
+    """
+
+
+def _parse_seconds(value: Any) -> float | None:
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds > 0 else None
+
+
+class Deadline:
+    """
+    Monotonic deadline for one tool invocation.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_parameters(
+        cls,
+        tool_parameters: Mapping[str, Any],
+        credentials: Mapping[str, Any],
+        default: float,
+    ) -> "Deadline":
+        """
+        Resolve the budget from the tool's ``deadline`` parameter, then the
+        provider's ``default_deadline`` credential, then the tool default.
+        """
+        seconds = (
+            _parse_seconds(tool_parameters.get("deadline"))
+            or _parse_seconds(credentials.get("default_deadline"))
+            or default
+        )
+        return cls(seconds)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, step: str) -> None:
+        """
+        Raise ``DeadlineExceededError`` if the budget is gone before ``step``.
+        """
+        if self.expired():
+            raise DeadlineExceededError(f"Deadline of {self.seconds:g}s exceeded before {step}")
+
+    def timeout(self, cap: float | None = None, step: str = "request") -> float:
+        """
+        Return the timeout for the next network call: the remaining budget,
+        capped at ``cap`` seconds when given.
+        """
+        self.check(step)
+        remaining = self.remaining()
+        return min(cap, remaining) if cap is not None else remaining
+
+    def sleep(self, seconds: float, step: str = "next poll") -> None:
+        """
+        Sleep for ``seconds`` but never past the deadline.
+        """
+        time.sleep(max(min(seconds, self.remaining()), 0))
+        self.check(step)
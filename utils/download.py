@@ -0,0 +1,296 @@
+"""
+Range-based parallel, resumable download of large result files.
+
+Generated videos can be tens of megabytes, and a single GET that drops
+halfway has to start again from zero. ``download`` first asks for the
+first byte (``Range: bytes=0-0``) to learn the size and whether the server
+serves ranges. If it does, the file is split into up to
+``GPTPROTO_DOWNLOAD_SEGMENTS`` ranges (default 4) of at least
+``GPTPROTO_DOWNLOAD_MIN_SEGMENT`` bytes (default 4 MiB) that are fetched in
+parallel and written at their offsets. A segment whose connection drops is
+resumed from the last byte received, up to ``GPTPROTO_DOWNLOAD_RETRIES``
+times (default 3). Later requests carry ``If-Range`` with the file's
+validator, so a file that changes mid-download fails instead of being
+stitched together from two versions.
+
+Servers without range support get one plain GET. Either way, the bytes
+written are checked against the advertised length before the file is used.
+
+Bodies are read with ``iter_body``, which returns bytes as they arrive and
+checks the invocation deadline between reads, so a server that trickles
+the file cannot hold the call past its deadline.
+"""
+
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from collections.abc import Iterator
+from typing import BinaryIO
+
+import requests
+import urllib3
+
+from utils import http_pool
+from utils.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS = int(os.environ.get("GPTPROTO_DOWNLOAD_SEGMENTS", "4"))
+MIN_SEGMENT = int(os.environ.get("GPTPROTO_DOWNLOAD_MIN_SEGMENT", str(4 * 1024 * 1024)))
+RETRIES = int(os.environ.get("GPTPROTO_DOWNLOAD_RETRIES", "3"))
+
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadError(Exception):
+    """
+    Raised when a download fails, is cut short or changes while downloading.
+    """
+
+
+@dataclass
+class _Segment:
+    start: int
+    end: int  # Inclusive, as in a Range header
+    received: int = 0
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    @property
+    def done(self) -> bool:
+        return self.received >= self.size
+
+
+class _Sink:
+    """
+    Writes blocks at given offsets of one file from several threads.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self._lock = threading.Lock()
+
+    def write_at(self, offset: int, data: bytes) -> None:
+        with self._lock:
+            self.file.seek(offset)
+            self.file.write(data)
+
+
+def _timeout(deadline: Deadline) -> tuple[float, float]:
+    return (deadline.timeout(CONNECT_TIMEOUT), deadline.timeout(READ_TIMEOUT))
+
+
+def iter_body(
+    response: requests.Response,
+    deadline: Deadline,
+    step: str,
+    chunk_size: int = CHUNK_SIZE,
+    read_timeout: float = READ_TIMEOUT,
+) -> Iterator[bytes]:
+    """
+    Yield the body of a streamed response, checking ``deadline`` per read.
+
+    ``iter_content`` waits for a full ``chunk_size`` before yielding, which
+    a slow server can stretch past the deadline; here each read returns
+    what has arrived (at most ``chunk_size`` bytes). The socket timeout is
+    reset to ``read_timeout``, capped at the remaining budget, after every
+    read, as in ``text_stream._read_chunks``, so a server that goes silent
+    is cut off too. Errors are raised as the ``requests`` exceptions ``iter_content``
+    would raise.
+    """
+    raw = response.raw
+    if not hasattr(raw, "read1"):
+        # HTTP/2 responses arrive whole; older urllib3 has no read1
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            deadline.check(step)
+            yield chunk
+        return
+
+    sock = getattr(getattr(raw, "connection", None), "sock", None)
+    while True:
+        try:
+            chunk = raw.read1(chunk_size, decode_content=True)
+        except urllib3.exceptions.ReadTimeoutError as e:
+            deadline.check(step)
+            raise requests.exceptions.ConnectionError(e) from e
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e) from e
+        except urllib3.exceptions.DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e) from e
+        if not chunk:
+            return
+        deadline.check(step)
+        yield chunk
+        if sock is not None:
+            sock.settimeout(max(min(read_timeout, deadline.remaining()), 0.01))
+
+
+def _validator(response: requests.Response) -> str | None:
+    # If-Range only accepts a strong ETag or a date
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def split(total: int, segments: int = SEGMENTS, min_segment: int = MIN_SEGMENT) -> list[tuple[int, int]]:
+    """
+    Split ``total`` bytes into at most ``segments`` inclusive byte ranges.
+    """
+    count = max(1, min(segments, total // max(min_segment, 1)))
+    size = -(-total // count)
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def _fetch_segment(
+    url: str,
+    segment: _Segment,
+    sink: _Sink,
+    validator: str | None,
+    deadline: Deadline,
+    failed: threading.Event,
+) -> None:
+    for attempt in range(RETRIES + 1):
+        offset = segment.start + segment.received
+        headers = {"Range": f"bytes={offset}-{segment.end}"}
+        if validator:
+            headers["If-Range"] = validator
+        try:
+            with http_pool.get(url, headers=headers, stream=True, timeout=_timeout(deadline)) as response:
+                if response.status_code != 206:
+                    # A 200 to If-Range means the file changed since the first request
+                    raise DownloadError(f"Range request for bytes {offset}-{segment.end} got HTTP {response.status_code}")
+                match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+                if not match or int(match.group(1)) != offset:
+                    raise DownloadError(f"Unexpected Content-Range for bytes {offset}-{segment.end}")
+
+                for chunk in iter_body(response, deadline, "download completed"):
+                    if failed.is_set():
+                        return
+                    if segment.received + len(chunk) > segment.size:
+                        raise DownloadError(f"Range {segment.start}-{segment.end} returned too many bytes")
+                    sink.write_at(segment.start + segment.received, chunk)
+                    segment.received += len(chunk)
+            if segment.done:
+                return
+        except requests.exceptions.RequestException as e:
+            deadline.check("download completed")
+            if attempt >= RETRIES:
+                raise DownloadError(f"Download of bytes {segment.start}-{segment.end} failed: {e}") from e
+            logger.warning(
+                "Download of bytes %d-%d interrupted at byte %d (%s); resuming",
+                segment.start,
+                segment.end,
+                segment.start + segment.received,
+                e,
+            )
+        deadline.check("download resumed")
+
+    if not segment.done:
+        raise DownloadError(f"Range {segment.start}-{segment.end} ended after {segment.received} of {segment.size} bytes")
+
+
+def _download_ranges(
+    url: str,
+    total: int,
+    validator: str | None,
+    sink: _Sink,
+    deadline: Deadline,
+    segments: int,
+    min_segment: int,
+    head: int,
+) -> None:
+    parts = [_Segment(start, end) for start, end in split(total, segments, min_segment)]
+    # The probe already received the first ``head`` bytes
+    parts[0].received = head
+    failed = threading.Event()
+
+    def run(segment: _Segment) -> None:
+        try:
+            if not segment.done:
+                _fetch_segment(url, segment, sink, validator, deadline, failed)
+        except BaseException:
+            failed.set()
+            raise
+
+    if len(parts) == 1:
+        run(parts[0])
+    else:
+        with ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix="gptproto-download") as pool:
+            futures = [pool.submit(run, segment) for segment in parts]
+        for future in futures:
+            future.result()
+
+    received = sum(segment.received for segment in parts)
+    if received != total:
+        raise DownloadError(f"Download incomplete: received {received} of {total} bytes")
+    logger.info("Downloaded %d bytes in %d ranges", total, len(parts))
+
+
+def _download_whole(response: requests.Response, sink: _Sink, deadline: Deadline) -> int:
+    expected = response.headers.get("Content-Length")
+    # A compressed body is decoded on read, so its Content-Length does not apply
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        expected = None
+    received = 0
+    for chunk in iter_body(response, deadline, "download completed"):
+        sink.write_at(received, chunk)
+        received += len(chunk)
+    if expected is not None and expected.isdigit() and received != int(expected):
+        raise DownloadError(f"Download incomplete: received {received} of {expected} bytes")
+    return received
+
+
+def download(
+    url: str,
+    file: BinaryIO,
+    deadline: Deadline,
+    segments: int = SEGMENTS,
+    min_segment: int = MIN_SEGMENT,
+) -> int:
+    """
+    Download ``url`` into the seekable binary ``file``; return its length.
+
+    Raises ``DownloadError`` if the download fails after its retries, the
+    file changes while downloading, or fewer bytes arrive than advertised,
+    and ``DeadlineExceededError`` once ``deadline`` has passed.
+    """
+    try:
+        response = http_pool.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=_timeout(deadline))
+    except requests.exceptions.RequestException as e:
+        raise DownloadError(f"Download failed: {e}") from e
+
+    sink = _Sink(file)
+    with response:
+        if response.status_code == 200:
+            # No range support: the whole file is already on its way
+            try:
+                return _download_whole(response, sink, deadline)
+            except requests.exceptions.RequestException as e:
+                deadline.check("download completed")
+                raise DownloadError(f"Download failed: {e}") from e
+        if response.status_code == 416:
+            # Range not satisfiable on an empty file
+            return 0
+        if response.status_code != 206:
+            raise DownloadError(f"Failed to download file: HTTP {response.status_code}")
+
+        match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+        if not match or match.group(3) == "*":
+            raise DownloadError("Server sent a partial response without the file length")
+        total = int(match.group(3))
+        validator = _validator(response)
+        head = response.content[:1]
+        sink.write_at(0, head)
+
+    _download_ranges(url, total, validator, sink, deadline, segments, min_segment, len(head))
+    return total
@@ -0,0 +1,271 @@
+"""
+Process-wide pooled HTTP session shared by all GPTProto tools.
+
+Every tool goes through ``get``/``post`` here instead of the bare
+``requests`` functions, so submits and polls to the same host reuse
+keep-alive connections instead of paying a new TCP+TLS handshake each time.
+
+Pool sizing is configured through environment variables:
+
+- ``GPTPROTO_POOL_CONNECTIONS``: number of per-host pools to keep (default 10)
+- ``GPTPROTO_POOL_MAXSIZE``: connections kept per host (default 32)
+- ``GPTPROTO_KEEPALIVE_IDLE``: TCP keep-alive idle seconds, 0 disables (default 60)
+- ``GPTPROTO_POOL_STATS_EVERY``: log the per-host connection reuse counters
+  at INFO every this many connection checkouts, 0 disables (default 100)
+- ``GPTPROTO_HTTP2``: set to ``1`` to send prediction API calls over one
+  multiplexed HTTP/2 connection (requires ``httpx[http2]``)
+- ``GPTPROTO_HTTP2_PREFIXES``: comma-separated URL prefixes that use HTTP/2
+  (default ``https://gptproto.com/api/v3``)
+"""
+
+import logging
+import os
+import socket
+import threading
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+POOL_CONNECTIONS = int(os.environ.get("GPTPROTO_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.environ.get("GPTPROTO_POOL_MAXSIZE", "32"))
+KEEPALIVE_IDLE = int(os.environ.get("GPTPROTO_KEEPALIVE_IDLE", "60"))
+POOL_STATS_EVERY = int(os.environ.get("GPTPROTO_POOL_STATS_EVERY", "100"))
+HTTP2_ENABLED = os.environ.get("GPTPROTO_HTTP2", "").lower() in ("1", "true", "yes")
+HTTP2_PREFIXES = tuple(
+    prefix.strip()
+    for prefix in os.environ.get("GPTPROTO_HTTP2_PREFIXES", "https://gptproto.com/api/v3").split(",")
+    if prefix.strip()
+)
+
+
+class _PoolStats:
+    """
+    Thread-safe per-host counters of reused (hit) and newly opened (miss) connections.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[str, int]] = {}
+        self._total = 0
+
+    def record(self, host: str, reused: bool) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(host, {"hits": 0, "misses": 0})
+            counters["hits" if reused else "misses"] += 1
+            self._total += 1
+            total = self._total
+        if POOL_STATS_EVERY > 0 and total % POOL_STATS_EVERY == 0:
+            # The plugin process cannot be inspected from outside; the log can
+            logger.info(
+                "Connection reuse after %d requests: %s",
+                total,
+                ", ".join(f"{host} {c['hits']} hits / {c['misses']} misses" for host, c in self.snapshot().items()),
+            )
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {host: dict(counters) for host, counters in self._counters.items()}
+
+
+_stats = _PoolStats()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _get_conn(self, timeout: float | None = None) -> Any:
+        conn = super()._get_conn(timeout)
+        # An idle keep-alive connection still holds its socket; a fresh or
+        # dropped one has to connect again.
+        reused = getattr(conn, "sock", None) is not None
+        _stats.record(self.host, reused)
+        if not reused:
+            logger.debug("Opening new connection to %s (pool miss)", self.host)
+        return conn
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool, _CountingHTTPConnectionPool):
+    pass
+
+
+def _socket_options() -> list[tuple[int, int, int]]:
+    options = list(HTTPConnection.default_socket_options)
+    if KEEPALIVE_IDLE > 0:
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE))
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(KEEPALIVE_IDLE // 4, 1)))
+    return options
+
+
+class _PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose per-host connection pools count hits and misses.
+    """
+
+    def init_poolmanager(self, connections: int, maxsize: int, block: bool = False, **pool_kwargs: Any) -> None:
+        pool_kwargs.setdefault("socket_options", _socket_options())
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+# The adapter (and therefore the connection pools) is shared by the whole
+# process; Session objects are kept per thread because they are not safe to
+# mutate concurrently.
+_adapter = _PooledAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the calling thread's session, backed by the shared connection pools.
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("https://", _adapter)
+        session.mount("http://", _adapter)
+        _local.session = session
+    return session
+
+
+_http2_lock = threading.Lock()
+_http2_client: Any = None
+_http2_unavailable = False
+
+
+def _get_http2_client() -> Any:
+    """
+    Return the shared HTTP/2 client, or None when HTTP/2 is disabled or httpx/h2 is missing.
+    """
+    global _http2_client, _http2_unavailable
+    if not HTTP2_ENABLED or _http2_unavailable:
+        return None
+    if _http2_client is not None:
+        return _http2_client
+    with _http2_lock:
+        if _http2_client is None and not _http2_unavailable:
+            try:
+                import httpx
+
+                _http2_client = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(
+                        max_connections=POOL_MAXSIZE,
+                        max_keepalive_connections=POOL_MAXSIZE,
+                    ),
+                )
+            except ImportError:
+                logger.warning("GPTPROTO_HTTP2 is set but httpx[http2] is not installed, using HTTP/1.1")
+                _http2_unavailable = True
+            except Exception as e:
+                # e.g. httpcore importing trio after gevent removed select.epoll
+                logger.warning("GPTPROTO_HTTP2 is set but the HTTP/2 client failed to start, using HTTP/1.1: %s", e)
+                _http2_unavailable = True
+    return _http2_client
+
+
+def _http2_timeout(timeout: Any) -> Any:
+    import httpx
+
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _to_requests_response(response: Any) -> requests.Response:
+    """
+    Copy a fully read ``httpx.Response`` into a ``requests.Response``.
+
+    Callers then get the same ``ok``, ``iter_content``, ``raise_for_status``
+    and ``json()`` (whose decode errors are ``RequestException``s) on both
+    transports.
+    """
+    result = requests.Response()
+    result.status_code = response.status_code
+    result.reason = response.reason_phrase
+    result.url = str(response.url)
+    # items() joins repeated headers with ", ", as requests does
+    result.headers = CaseInsensitiveDict(response.headers.items())
+    result.encoding = get_encoding_from_headers(result.headers)
+    result.elapsed = response.elapsed
+    result._content = response.content
+    result._content_consumed = True
+    return result
+
+
+def _request_http2(client: Any, method: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    Send a request over the multiplexed HTTP/2 client.
+
+    The response is converted to a ``requests.Response`` and errors are
+    re-raised as their ``requests`` equivalents, so callers cannot tell the
+    transports apart.
+    """
+    import httpx
+
+    if "timeout" in kwargs:
+        kwargs["timeout"] = _http2_timeout(kwargs["timeout"])
+    if "allow_redirects" in kwargs:
+        kwargs["follow_redirects"] = kwargs.pop("allow_redirects")
+    if isinstance(kwargs.get("data"), (bytes, str)):
+        # httpx takes raw bodies as ``content``; ``data`` is for form fields
+        kwargs["content"] = kwargs.pop("data")
+    try:
+        response = client.request(method, url, **kwargs)
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e)) from e
+    except httpx.TransportError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    except httpx.TooManyRedirects as e:
+        raise requests.exceptions.TooManyRedirects(str(e)) from e
+    except httpx.InvalidURL as e:
+        raise requests.exceptions.InvalidURL(str(e)) from e
+    except httpx.HTTPError as e:
+        raise requests.exceptions.RequestException(str(e)) from e
+    return _to_requests_response(response)
+
+
+def request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    Send a request through the shared pools.
+
+    Non-streaming calls to an HTTP/2 prefix go over the multiplexed client
+    when it is enabled; its responses and errors are converted to their
+    ``requests`` equivalents.
+    """
+    if not kwargs.get("stream") and url.startswith(HTTP2_PREFIXES):
+        client = _get_http2_client()
+        if client is not None:
+            kwargs.pop("stream", None)
+            return _request_http2(client, method, url, **kwargs)
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """
+    Return connection reuse counters per host, e.g.
+    ``{"gptproto.com": {"hits": 118, "misses": 2}}``.
+
+    The same counters are logged at INFO every ``GPTPROTO_POOL_STATS_EVERY``
+    connection checkouts.
+    """
+    return _stats.snapshot()
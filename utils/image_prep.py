@@ -0,0 +1,138 @@
+"""
+Optional downscaling of input images before they are sent inline.
+
+Gemini downsamples large images itself, so a 12 MP phone photo mostly costs
+upload time. With ``GPTPROTO_IMAGE_DOWNSCALE=1`` (requires Pillow; add
+``Pillow`` to ``requirements.txt``), ``inline_media.fetch`` passes each
+downloaded image through ``downscale``:
+
+- JPEGs are decoded at a reduced scale where possible, EXIF orientation is
+  applied, and the image is resized so its longer edge fits the tool's
+  ``IMAGE_MAX_EDGE``
+- the result is re-encoded as WebP at ``GPTPROTO_IMAGE_QUALITY`` (default
+  85); EXIF and XMP metadata are dropped, the ICC colour profile is kept
+
+Animated images, files Pillow cannot read, and images that are already
+small enough and would not get smaller are sent unchanged. The work runs
+on a pool of OS threads (gevent's pool when the process is monkey-patched)
+so it does not block other requests.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import Executor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import IO, Any
+
+from utils.deadline import Deadline, DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("GPTPROTO_IMAGE_DOWNSCALE", "").lower() in ("1", "true", "yes")
+QUALITY = int(os.environ.get("GPTPROTO_IMAGE_QUALITY", "85"))
+WORKERS = 2
+SPOOL_BYTES = 1024 * 1024
+OUTPUT_MIME_TYPE = "image/webp"
+
+_lock = threading.Lock()
+_executor: Executor | None = None
+_unavailable = False
+
+
+def enabled() -> bool:
+    """
+    Whether downscaling is switched on and Pillow is installed.
+    """
+    global _unavailable
+    if not ENABLED or _unavailable:
+        return False
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        logger.warning("GPTPROTO_IMAGE_DOWNSCALE is set but Pillow is not installed, sending images unchanged")
+        _unavailable = True
+        return False
+    return True
+
+
+def _get_executor() -> Executor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            try:
+                from gevent import monkey
+
+                patched = monkey.is_module_patched("threading")
+            except ImportError:
+                patched = False
+            if patched:
+                # Patched threads are greenlets on one OS thread; use real ones
+                from gevent.threadpool import ThreadPoolExecutor
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=WORKERS)
+    return _executor
+
+
+def _size(file: IO[bytes]) -> int:
+    file.seek(0, os.SEEK_END)
+    return file.tell()
+
+
+def _downscale(source: IO[bytes], max_edge: int, quality: int) -> IO[bytes] | None:
+    from PIL import Image, ImageOps
+
+    original_size = _size(source)
+    source.seek(0)
+    try:
+        image: Any = Image.open(source)
+    except (Image.UnidentifiedImageError, OSError):
+        return None
+
+    with image:
+        if getattr(image, "is_animated", False):
+            return None
+        # JPEG only: decode at the smallest 1/2^n scale still above max_edge
+        image.draft("RGB", (max_edge, max_edge))
+        icc_profile = image.info.get("icc_profile")
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = ImageOps.exif_transpose(image)
+        resized = max(image.size) > max_edge
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        # Only the colour profile is carried over; EXIF and XMP are dropped.
+        # method=0 is the fastest encoder setting; slower ones cost far more
+        # time than their few percent of size saves on the upload
+        image.save(output, "WEBP", quality=quality, method=0, icc_profile=icc_profile)
+
+    if not resized and output.tell() >= original_size:
+        output.close()
+        return None
+    logger.info("Downscaled image from %d to %d bytes", original_size, output.tell())
+    output.seek(0)
+    return output
+
+
+def downscale(source: IO[bytes], max_edge: int, deadline: Deadline, quality: int = QUALITY) -> IO[bytes] | None:
+    """
+    Return ``source`` downscaled and re-encoded as WebP, or None to send it
+    as is. Runs on the worker pool and waits at most until the deadline.
+    """
+    future = _get_executor().submit(_downscale, source, max_edge, quality)
+    try:
+        try:
+            return future.result(timeout=deadline.timeout(step="image downscale"))
+        except FutureTimeoutError:
+            # The worker still holds ``source``, so never hand it back early
+            deadline.check("image downscale finished")
+            return future.result()
+    except DeadlineExceededError:
+        raise
+    except Exception as e:
+        logger.warning("Image downscale failed, sending the original: %s", e)
+        return None
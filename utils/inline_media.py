@@ -0,0 +1,268 @@
+"""
+Inline media for Gemini requests, encoded and sent without whole-file copies.
+
+Gemini takes images inline as base64 in the JSON body (``inlineData``).
+Building that the obvious way holds the download, its base64 bytes, the
+decoded ``str`` and the serialized body in memory at once, four to five
+times the image size. Here the download is base64-encoded chunk by chunk
+into a spooled temporary file (kept in memory up to
+``GPTPROTO_INLINE_SPOOL_BYTES``, default 1 MiB, then on disk) and
+``InlineData`` stands in for the payload in the request dict.
+
+``body_kwargs`` serializes a request that contains ``InlineData`` into a
+``RequestBody``: the JSON around the payloads is rendered once, and the
+payloads are copied from their spools in chunks while ``requests`` sends
+the body with an exact ``Content-Length``. A body can be sent more than
+once (retries, continuations).
+
+Encoded payloads are kept in ``utils.media_cache`` so repeat calls for the
+same image skip both the download and the encode. Callers that pass
+``max_edge`` get the image downscaled first when ``utils.image_prep`` is
+enabled. The media type is sniffed from the first chunk
+(``utils.media_type``), and a download that fails or is not an allowed
+type raises ``MediaError`` before anything is sent upstream.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections.abc import Collection, Iterator
+from typing import IO, Any
+
+from utils import download, http_pool, image_prep, media_cache, media_type
+from utils.deadline import Deadline
+
+SPOOL_BYTES = int(os.environ.get("GPTPROTO_INLINE_SPOOL_BYTES", str(1024 * 1024)))
+DOWNLOAD_TIMEOUT = 30
+# A multiple of 3, so every full chunk encodes to base64 without padding
+CHUNK_SIZE = 3 * 64 * 1024
+
+_MARKER = "\x00gptproto-inline:"
+_PLACEHOLDER = re.compile(rb'"\\u0000gptproto-inline:(\d+)"')
+
+
+class InlineData:
+    """
+    Base64 payload of an ``inlineData`` part, held in a spooled file.
+    """
+
+    def __init__(self, spool: IO[bytes], length: int, mime_type: str):
+        self._spool = spool
+        self._length = length
+        self.mime_type = mime_type
+
+    def __len__(self) -> int:
+        return self._length
+
+    def chunks(self, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Yield the encoded payload from the start.
+        """
+        self._spool.seek(0)
+        return iter(lambda: self._spool.read(size), b"")
+
+    def close(self) -> None:
+        self._spool.close()
+
+
+class Base64Writer:
+    """
+    Encodes bytes written in arbitrary pieces into a binary file as base64.
+    """
+
+    def __init__(self, sink: IO[bytes]):
+        self.sink = sink
+        self.length = 0
+        self._pending = b""
+
+    def write(self, data: bytes) -> None:
+        if self._pending:
+            data = self._pending + data
+        cut = len(data) - len(data) % 3
+        self._pending = data[cut:]
+        if cut:
+            self._emit(base64.b64encode(memoryview(data)[:cut]))
+
+    def finish(self) -> None:
+        if self._pending:
+            self._emit(base64.b64encode(self._pending))
+            self._pending = b""
+
+    def _emit(self, encoded: bytes) -> None:
+        self.sink.write(encoded)
+        self.length += len(encoded)
+
+
+def _encode(source: IO[bytes], spool: IO[bytes]) -> int:
+    writer = Base64Writer(spool)
+    source.seek(0)
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        writer.write(chunk)
+    writer.finish()
+    return writer.length
+
+
+def fetch(
+    url: str,
+    deadline: Deadline,
+    max_edge: int | None = None,
+    allowed: Collection[str] = media_type.IMAGE_TYPES,
+) -> InlineData:
+    """
+    Download ``url`` as base64-encoded ``InlineData``.
+
+    Raises ``MediaError`` if the download fails or its sniffed type is not
+    in ``allowed``. With ``max_edge`` set and ``utils.image_prep`` enabled,
+    the image is downscaled to fit it before encoding. A payload in
+    ``utils.media_cache`` is revalidated with a conditional GET and reused
+    on ``304``; a fresh download is added to the cache. A download that is
+    still running at ``deadline`` raises ``DeadlineExceededError``, however
+    steadily the server keeps sending.
+    """
+    prepare = max_edge is not None and image_prep.enabled()
+    variant = f"max_edge={max_edge},quality={image_prep.QUALITY}" if prepare else ""
+    # Downscaled payloads are cached apart from the original and per setting
+    key = f"{url}#{variant}" if variant else url
+    cache = media_cache.get_cache()
+    cached = cache.lookup(key) if cache else None
+    if cached and cached[0].mime_type not in allowed:
+        # Entries from before type sniffing, or checked against other types
+        cached[1].close()
+        cached = None
+    headers = cached[0].conditional_headers() if cached else {}
+    try:
+        response = http_pool.get(url, headers=headers, stream=True, timeout=deadline.timeout(DOWNLOAD_TIMEOUT))
+    except Exception as e:
+        if cached:
+            cached[1].close()
+        deadline.check("image download")
+        raise media_type.MediaError(f"Could not download {url}: {e}") from e
+
+    with response:
+        if cached:
+            entry, payload = cached
+            if response.status_code == 304:
+                cache.record(hit=True)
+                return InlineData(payload, entry.length, entry.mime_type)
+            payload.close()
+        if response.status_code != 200:
+            raise media_type.MediaError(f"Could not download {url}: HTTP {response.status_code}")
+        digest = hashlib.sha256(variant.encode("utf-8"))
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        # Downscaling needs the whole image, so it is downloaded first
+        raw = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) if prepare else None
+        writer = Base64Writer(spool)
+        mime_type = None
+        head = b""
+
+        def consume(chunk: bytes) -> None:
+            digest.update(chunk)
+            if raw is not None:
+                raw.write(chunk)
+            else:
+                writer.write(chunk)
+
+        try:
+            # Bytes are taken as they arrive and the deadline is checked after each read
+            for chunk in download.iter_body(response, deadline, "image download", CHUNK_SIZE):
+                if mime_type is None:
+                    # Stop once the sniffing bytes are in rather than after the whole file
+                    head += chunk
+                    if len(head) < media_type.SNIFF_BYTES:
+                        continue
+                    mime_type = media_type.check(
+                        head[: media_type.SNIFF_BYTES], response.headers.get("Content-Type"), url, allowed
+                    )
+                    chunk, head = head, b""
+                consume(chunk)
+            if mime_type is None:
+                # Shorter than the sniffing window, or empty
+                mime_type = media_type.check(head, response.headers.get("Content-Type"), url, allowed)
+                consume(head)
+            writer.finish()
+        except Exception as e:
+            spool.close()
+            if raw is not None:
+                raw.close()
+            if isinstance(e, media_type.MediaError):
+                raise
+            deadline.check("image download")
+            raise media_type.MediaError(f"Could not download {url}: {e}") from e
+
+    length = writer.length
+    if raw is not None:
+        with raw:
+            try:
+                processed = image_prep.downscale(raw, max_edge, deadline)
+            except BaseException:
+                spool.close()
+                raise
+            if processed is not None:
+                mime_type = image_prep.OUTPUT_MIME_TYPE
+                with processed:
+                    length = _encode(processed, spool)
+            else:
+                length = _encode(raw, spool)
+
+    data = InlineData(spool, length, mime_type)
+    if cache:
+        cache.record(hit=False)
+        if media_cache.cacheable(response.headers):
+            cache.store(key, response.headers, digest.hexdigest(), len(data), data.chunks(), mime_type)
+    return data
+
+
+class RequestBody:
+    """
+    A JSON request body whose ``InlineData`` payloads are streamed.
+
+    ``requests`` takes the length from ``__len__`` and sends what
+    ``__iter__`` yields.
+    """
+
+    def __init__(self, pieces: list[bytes], media: list[InlineData]):
+        # pieces[i] precedes media[i]; the last piece follows all of them
+        self._pieces = pieces
+        self._media = media
+
+    def __len__(self) -> int:
+        return sum(len(piece) for piece in self._pieces) + sum(len(media) + 2 for media in self._media)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for piece, media in zip(self._pieces, self._media):
+            yield piece + b'"'
+            yield from media.chunks()
+            yield b'"'
+        yield self._pieces[-1]
+
+
+def body_kwargs(data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Keyword arguments for ``http_pool.post`` that send ``data`` as JSON.
+
+    Requests without ``InlineData`` go through ``json=`` as before.
+    """
+    media: list[InlineData] = []
+
+    def placeholder(value: Any) -> str:
+        if isinstance(value, InlineData):
+            media.append(value)
+            return f"{_MARKER}{len(media) - 1}"
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    text = json.dumps(data, default=placeholder, allow_nan=False).encode("utf-8")
+    if not media:
+        return {"json": data}
+
+    pieces: list[bytes] = []
+    ordered: list[InlineData] = []
+    last = 0
+    for match in _PLACEHOLDER.finditer(text):
+        pieces.append(text[last : match.start()])
+        ordered.append(media[int(match.group(1))])
+        last = match.end()
+    pieces.append(text[last:])
+    return {"data": RequestBody(pieces, ordered)}
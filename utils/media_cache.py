@@ -0,0 +1,267 @@
+"""
+Content-addressed cache of encoded input media.
+
+The same product photos and reference images are sent to the Gemini tools
+over and over. ``inline_media.fetch`` keeps the base64 payload of each
+download here, so a repeat call costs one conditional GET: the cached
+``ETag``/``Last-Modified`` go out as ``If-None-Match``/``If-Modified-Since``
+and a ``304`` is served from the cache with neither download nor encode.
+
+Payloads are stored by the SHA-256 of the original bytes, so the same image
+behind different URLs is kept once; a small per-URL index maps each URL
+to its validators and digest. Both tiers are bounded by bytes and evict the
+least recently used payloads:
+
+- memory: ``GPTPROTO_MEDIA_CACHE_MEMORY`` bytes (default 0, off: the
+  plugin runs within 1 MiB of declared memory, so the disk tier carries
+  the cache); payloads over a quarter of it stay on disk only
+- disk: ``GPTPROTO_MEDIA_CACHE_DISK`` bytes (default 256 MiB) under
+  ``GPTPROTO_MEDIA_CACHE_DIR`` (default ``gptproto-media`` in the system
+  temp directory)
+
+Setting a budget to ``0`` disables that tier. Responses without a
+validator, or marked ``Cache-Control: no-store``, are not cached.
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping
+from dataclasses import asdict, dataclass
+from typing import IO
+
+logger = logging.getLogger(__name__)
+
+MEMORY_BYTES = int(os.environ.get("GPTPROTO_MEDIA_CACHE_MEMORY", "0"))
+DISK_BYTES = int(os.environ.get("GPTPROTO_MEDIA_CACHE_DISK", str(256 * 1024 * 1024)))
+DIRECTORY = os.environ.get("GPTPROTO_MEDIA_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "gptproto-media")
+
+
+@dataclass
+class CacheEntry:
+    """
+    What the cache knows about one URL.
+    """
+
+    digest: str
+    length: int
+    etag: str | None = None
+    last_modified: str | None = None
+    mime_type: str | None = None
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def cacheable(headers: Mapping[str, str]) -> bool:
+    """
+    Whether a response can be cached: it has a validator and allows storing.
+    """
+    if "no-store" in headers.get("Cache-Control", "").lower():
+        return False
+    return bool(headers.get("ETag") or headers.get("Last-Modified"))
+
+
+class MediaCache:
+    """
+    Memory and disk tiers of encoded payloads plus the URL index.
+    """
+
+    def __init__(self, directory: str = DIRECTORY, memory_bytes: int = MEMORY_BYTES, disk_bytes: int = DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._index: dict[str, CacheEntry] = {}
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_used = 0
+        self.hits = 0
+        self.misses = 0
+        if disk_bytes > 0:
+            try:
+                os.makedirs(os.path.join(directory, "urls"), exist_ok=True)
+                os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+            except OSError as e:
+                logger.warning("Media cache directory %s unavailable, using memory only: %s", directory, e)
+                self.disk_bytes = 0
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "blobs", f"{digest}.b64")
+
+    def _index_path(self, url: str) -> str:
+        return os.path.join(self.directory, "urls", f"{_url_key(url)}.json")
+
+    def lookup(self, url: str) -> tuple[CacheEntry, IO[bytes]] | None:
+        """
+        Return the entry for ``url`` and its payload opened for reading.
+
+        The payload is opened up front so it cannot be evicted between the
+        conditional request and its ``304``.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+        if entry is None and self.disk_bytes > 0:
+            try:
+                with open(self._index_path(url), encoding="utf-8") as f:
+                    entry = CacheEntry(**json.load(f))
+            except (OSError, ValueError, TypeError):
+                entry = None
+        if entry is None:
+            return None
+
+        with self._lock:
+            payload = self._memory.get(entry.digest)
+            if payload is not None:
+                self._memory.move_to_end(entry.digest)
+                self._index[url] = entry
+                return entry, io.BytesIO(payload)
+        if self.disk_bytes > 0:
+            path = self._blob_path(entry.digest)
+            try:
+                stream = open(path, "rb")
+                # Reads do not reliably update atime; mtime is the LRU clock
+                os.utime(path)
+            except OSError:
+                return None
+            with self._lock:
+                self._index[url] = entry
+            return entry, stream
+        return None
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def store(
+        self,
+        url: str,
+        headers: Mapping[str, str],
+        digest: str,
+        length: int,
+        chunks: Iterable[bytes],
+        mime_type: str | None = None,
+    ) -> None:
+        """
+        Cache the encoded payload of ``url`` from ``chunks``.
+        """
+        entry = CacheEntry(
+            digest=digest,
+            length=length,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+            mime_type=mime_type,
+        )
+        keep_in_memory = 0 < length <= self.memory_bytes // 4
+        payload = bytearray() if keep_in_memory else None
+        written = self.disk_bytes > 0 and length <= self.disk_bytes
+        if written and not os.path.exists(self._blob_path(digest)):
+            written = self._write_blob(digest, chunks, payload)
+            if not written:
+                payload = None
+        elif payload is not None:
+            for chunk in chunks:
+                payload += chunk
+        if not written and payload is None:
+            return
+
+        with self._lock:
+            self._index[url] = entry
+            if payload is not None and digest not in self._memory:
+                self._memory[digest] = bytes(payload)
+                self._memory_used += length
+                while self._memory_used > self.memory_bytes and self._memory:
+                    _, evicted = self._memory.popitem(last=False)
+                    self._memory_used -= len(evicted)
+        if written:
+            self._write_index(url, entry)
+            self._evict_disk()
+
+    def _write_blob(self, digest: str, chunks: Iterable[bytes], payload: bytearray | None) -> bool:
+        temporary = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=os.path.join(self.directory, "blobs"), suffix=".tmp", delete=False) as f:
+                temporary = f.name
+                for chunk in chunks:
+                    f.write(chunk)
+                    if payload is not None:
+                        payload += chunk
+            os.replace(temporary, self._blob_path(digest))
+            return True
+        except OSError as e:
+            logger.warning("Could not write media cache entry: %s", e)
+            if temporary:
+                with contextlib.suppress(OSError):
+                    os.unlink(temporary)
+            return False
+
+    def _write_index(self, url: str, entry: CacheEntry) -> None:
+        path = self._index_path(url)
+        try:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(asdict(entry), f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning("Could not write media cache index: %s", e)
+
+    def _evict_disk(self) -> None:
+        # Least recently used first; index files pointing at an evicted blob
+        # simply miss on their next lookup
+        blobs = os.path.join(self.directory, "blobs")
+        try:
+            files = [(f.stat().st_mtime, f.stat().st_size, f.path) for f in os.scandir(blobs) if f.name.endswith(".b64")]
+        except OSError:
+            return
+        used = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if used <= self.disk_bytes:
+                break
+            try:
+                os.unlink(path)
+                used -= size
+            except OSError:
+                pass
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+            }
+
+
+_cache: MediaCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> MediaCache | None:
+    """
+    Return the process-wide cache, or None when both tiers are disabled.
+    """
+    global _cache
+    if MEMORY_BYTES <= 0 and DISK_BYTES <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MediaCache()
+    return _cache
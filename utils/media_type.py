@@ -0,0 +1,301 @@
+"""
+Media type detection for files sent to the Gemini tools.
+
+Guessing from the URL's extension mislabels signed CDN links, URLs with
+query strings and URLs without an extension, and Gemini then rejects or
+misreads the input after a full paid round trip. ``detect`` looks at the
+first bytes of the file instead, in this order:
+
+- magic bytes of the formats Gemini takes (images, video, audio, PDF, ...)
+- the ``Content-Type`` response header, unless it is a generic binary type
+- a suffix table lookup on the URL path, ignoring query and fragment
+- plain text, if the first bytes decode as UTF-8
+
+``check`` raises ``MediaError`` when the result is missing or not in the
+allowed set, so a bad input fails before the model is called. Inline
+images are sniffed from the first chunk of their download
+(``utils.inline_media``); files passed by URL are ``probe``d with a small
+ranged GET. Gemini fetches those itself and may reach URLs this plugin
+cannot (``gs://`` URIs, Files API URIs, host-restricted signed links), so
+a probe that cannot read the file falls back to the suffix table and only
+a file whose bytes identify it as unsupported is rejected.
+"""
+
+import codecs
+import logging
+import posixpath
+from collections.abc import Collection
+from urllib.parse import unquote, urlsplit
+
+from utils import download, http_pool
+from utils.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+SNIFF_BYTES = 512
+PROBE_TIMEOUT = 10
+
+IMAGE_TYPES = frozenset({"image/png", "image/jpeg", "image/webp", "image/gif", "image/heic", "image/heif"})
+VIDEO_TYPES = frozenset({
+    "video/mp4",
+    "video/mpeg",
+    "video/quicktime",
+    "video/x-msvideo",
+    "video/x-flv",
+    "video/webm",
+    "video/x-matroska",
+    "video/x-ms-wmv",
+    "video/3gpp",
+})
+AUDIO_TYPES = frozenset({"audio/wav", "audio/mpeg", "audio/aac", "audio/ogg", "audio/flac", "audio/mp4"})
+DOCUMENT_TYPES = frozenset({
+    "application/pdf",
+    "application/msword",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "text/plain",
+    "text/html",
+    "text/csv",
+    "text/markdown",
+})
+SUPPORTED_TYPES = IMAGE_TYPES | VIDEO_TYPES | AUDIO_TYPES | DOCUMENT_TYPES
+
+SUFFIXES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+    ".heic": "image/heic",
+    ".heif": "image/heif",
+    ".mp4": "video/mp4",
+    ".m4v": "video/mp4",
+    ".mpeg": "video/mpeg",
+    ".mpg": "video/mpeg",
+    ".mov": "video/quicktime",
+    ".avi": "video/x-msvideo",
+    ".flv": "video/x-flv",
+    ".webm": "video/webm",
+    ".mkv": "video/x-matroska",
+    ".wmv": "video/x-ms-wmv",
+    ".3gp": "video/3gpp",
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".aac": "audio/aac",
+    ".ogg": "audio/ogg",
+    ".flac": "audio/flac",
+    ".m4a": "audio/mp4",
+    ".pdf": "application/pdf",
+    ".doc": "application/msword",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".txt": "text/plain",
+    ".html": "text/html",
+    ".htm": "text/html",
+    ".csv": "text/csv",
+    ".md": "text/markdown",
+}
+
+# Fixed signatures at offset 0, longest first where one prefixes another;
+# text byte order marks come first so UTF-16 is not taken for MPEG audio
+_SIGNATURES = (
+    (b"\xef\xbb\xbf", "text/plain"),
+    (b"\xff\xfe", "text/plain"),
+    (b"\xfe\xff", "text/plain"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/msword"),
+    (b"\x00\x00\x01\xba", "video/mpeg"),
+    (b"\x00\x00\x01\xb3", "video/mpeg"),
+    (b"FLV\x01", "video/x-flv"),
+    (b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", "video/x-ms-wmv"),
+    (b"ID3", "audio/mpeg"),
+    (b"fLaC", "audio/flac"),
+    (b"OggS", "audio/ogg"),
+)
+_RIFF_FORMATS = {b"WEBP": "image/webp", b"AVI ": "video/x-msvideo", b"WAVE": "audio/wav"}
+_FTYP_BRANDS = {
+    b"isom": "video/mp4",
+    b"iso2": "video/mp4",
+    b"iso4": "video/mp4",
+    b"iso5": "video/mp4",
+    b"iso6": "video/mp4",
+    b"mp41": "video/mp4",
+    b"mp42": "video/mp4",
+    b"avc1": "video/mp4",
+    b"dash": "video/mp4",
+    b"mmp4": "video/mp4",
+    b"M4V ": "video/mp4",
+    b"M4VP": "video/mp4",
+    b"f4v ": "video/mp4",
+    b"qt  ": "video/quicktime",
+    b"heic": "image/heic",
+    b"heix": "image/heic",
+    b"hevc": "image/heic",
+    b"heim": "image/heic",
+    b"heis": "image/heic",
+    b"mif1": "image/heif",
+    b"msf1": "image/heif",
+    b"M4A ": "audio/mp4",
+    b"3gp4": "video/3gpp",
+    b"3gp5": "video/3gpp",
+    b"3gp6": "video/3gpp",
+    b"3g2a": "video/3gpp",
+    b"avif": "image/avif",
+    b"avis": "image/avif",
+}
+# Content types that say nothing about the content
+_GENERIC_TYPES = frozenset({"application/octet-stream", "binary/octet-stream", "application/binary", "application/unknown"})
+_YOUTUBE_HOSTS = frozenset({"youtube.com", "www.youtube.com", "m.youtube.com", "youtu.be"})
+
+
+class MediaError(ValueError):
+    """
+    Raised when an input file cannot be fetched or is not a supported type.
+    """
+
+
+def sniff(head: bytes) -> str | None:
+    """
+    Media type from the file's leading bytes, or None if unrecognised.
+    """
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF":
+        return _RIFF_FORMATS.get(head[8:12])
+    if head[4:8] == b"ftyp":
+        # Unknown brands are left to the header and suffix
+        return _FTYP_BRANDS.get(head[8:12])
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        # EBML; the DocType element near the start names WebM
+        return "video/webm" if b"webm" in head[:64] else "video/x-matroska"
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+        return "audio/aac"
+    if _is_mpeg_audio_frame(head):
+        return "audio/mpeg"
+    return None
+
+
+def _is_mpeg_audio_frame(head: bytes) -> bool:
+    # Frame sync plus a valid version, layer, bitrate and sample rate
+    if len(head) < 3 or head[0] != 0xFF or head[1] & 0xE0 != 0xE0:
+        return False
+    version = (head[1] >> 3) & 0x03
+    layer = (head[1] >> 1) & 0x03
+    bitrate = head[2] >> 4
+    sample_rate = (head[2] >> 2) & 0x03
+    return version != 0x01 and layer != 0x00 and bitrate not in (0x00, 0x0F) and sample_rate != 0x03
+
+
+def from_content_type(content_type: str | None) -> str | None:
+    """
+    Media type from a ``Content-Type`` header, without parameters.
+    """
+    if not content_type:
+        return None
+    mime_type = content_type.split(";", 1)[0].strip().lower()
+    if not mime_type or mime_type in _GENERIC_TYPES:
+        return None
+    return mime_type
+
+
+def from_url(url: str) -> str | None:
+    """
+    Media type from the suffix of the URL path, ignoring query and fragment.
+    """
+    path = unquote(urlsplit(url).path)
+    return SUFFIXES.get(posixpath.splitext(path)[1].lower())
+
+
+def _is_text(head: bytes) -> bool:
+    if not head or b"\x00" in head:
+        return False
+    try:
+        # Incremental, so a character cut off at the end of ``head`` is fine
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def detect(head: bytes, content_type: str | None = None, url: str = "") -> str | None:
+    """
+    Best media type for a file from its leading bytes, header and URL.
+    """
+    return (
+        sniff(head)
+        or from_content_type(content_type)
+        or from_url(url)
+        or ("text/plain" if _is_text(head) else None)
+    )
+
+
+def check(
+    head: bytes,
+    content_type: str | None,
+    url: str,
+    allowed: Collection[str] = SUPPORTED_TYPES,
+) -> str:
+    """
+    Return the media type of the file at ``url``, or raise ``MediaError``
+    if it cannot be determined or is not in ``allowed``.
+    """
+    if not head:
+        raise MediaError(f"File at {url} is empty")
+    mime_type = detect(head, content_type, url)
+    if mime_type is None:
+        raise MediaError(f"Could not determine the type of the file at {url}")
+    if mime_type not in allowed:
+        raise MediaError(f"Unsupported file type {mime_type} at {url}")
+    return mime_type
+
+
+def probe(
+    url: str,
+    deadline: Deadline,
+    allowed: Collection[str] = SUPPORTED_TYPES,
+    default: str = "application/octet-stream",
+) -> str:
+    """
+    Media type of the file at ``url`` for a request that passes the URL.
+
+    The first bytes are fetched with a ranged GET rather than HEAD, since
+    signed URLs are often valid for GET only. If they cannot be read, or
+    do not identify the file, the type comes from the URL suffix, or is
+    ``default``. Raises ``MediaError`` only when the bytes or the response
+    header identify the file as a type not in ``allowed``.
+    """
+    scheme = urlsplit(url).scheme.lower()
+    if scheme not in ("http", "https"):
+        # gs:// and similar URIs are for Gemini to resolve
+        return from_url(url) or default
+    if urlsplit(url).hostname in _YOUTUBE_HOSTS:
+        # Gemini reads YouTube links itself; the page is HTML, not the video
+        return "video/mp4"
+    try:
+        with http_pool.get(
+            url,
+            headers={"Range": f"bytes=0-{SNIFF_BYTES - 1}"},
+            stream=True,
+            timeout=deadline.timeout(PROBE_TIMEOUT),
+        ) as response:
+            if not 200 <= response.status_code < 300:
+                logger.info("Could not probe %s (HTTP %s), using its suffix", url, response.status_code)
+                return from_url(url) or default
+            head = b""
+            for chunk in download.iter_body(response, deadline, "file probe", SNIFF_BYTES, PROBE_TIMEOUT):
+                head += chunk
+                if len(head) >= SNIFF_BYTES:
+                    break
+            content_type = response.headers.get("Content-Type")
+    except Exception as e:
+        deadline.check("file probe")
+        logger.info("Could not probe %s (%s), using its suffix", url, e)
+        return from_url(url) or default
+
+    identified = sniff(head) or from_content_type(content_type)
+    if identified is not None and identified not in allowed:
+        raise MediaError(f"Unsupported file type {identified} at {url}")
+    return identified or from_url(url) or ("text/plain" if _is_text(head) else default)
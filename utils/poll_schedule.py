@@ -0,0 +1,101 @@
+"""
+Poll schedules for asynchronous prediction tasks.
+
+A schedule yields the sleep before each poll: an optional fast phase of
+short fixed intervals for models that often finish within seconds, then
+capped exponential growth. Every interval gets full jitter, so jobs that
+start together do not poll in lockstep.
+
+Tools pick one of the presets below or define their own ``PollSchedule``
+to tune polling per model.
+"""
+
+import random
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class PollSchedule:
+    """
+    Capped exponential poll schedule with full jitter.
+
+    :param initial: base interval after the fast phase, in seconds
+    :param multiplier: growth factor applied to the base interval after each poll
+    :param max_interval: upper bound for the base interval
+    :param min_interval: lower bound for a jittered sleep
+    :param fast_polls: number of polls in the fast phase
+    :param fast_interval: interval between fast-phase polls
+    :param jitter: draw each sleep uniformly from ``[min_interval, base]``
+    """
+
+    initial: float = 2.0
+    multiplier: float = 1.5
+    max_interval: float = 15.0
+    min_interval: float = 0.5
+    fast_polls: int = 0
+    fast_interval: float = 1.0
+    jitter: bool = True
+
+    def intervals(self, rng: random.Random | None = None) -> Iterator[float]:
+        """
+        Yield the sleep before each successive poll, forever.
+        """
+        rng = rng or random
+        for _ in range(self.fast_polls):
+            yield self.fast_interval
+
+        base = self.initial
+        while True:
+            capped = min(base, self.max_interval)
+            if self.jitter:
+                yield rng.uniform(min(self.min_interval, capped), capped)
+            else:
+                yield capped
+            base = capped * self.multiplier
+
+
+@dataclass(frozen=True)
+class PriorPollSchedule(PollSchedule):
+    """
+    Schedule informed by observed completion times.
+
+    The first poll lands near the median (``p50``); between ``p50`` and
+    ``p90`` the interval halves each time so polls get denser as most jobs
+    finish, and after ``p90`` polling falls back to the base backoff.
+    """
+
+    p50: float = 0.0
+    p90: float = 0.0
+
+    def intervals(self, rng: random.Random | None = None) -> Iterator[float]:
+        rng = rng or random
+        first = max(self.p50, self.min_interval)
+        # Slight jitter so jobs submitted together do not all poll at p50
+        first *= rng.uniform(0.9, 1.0) if self.jitter else 1.0
+        yield first
+
+        elapsed = first
+        dense = max(self.min_interval, (self.p90 - self.p50) / 10)
+        while elapsed < self.p90:
+            interval = max((self.p90 - elapsed) / 2, dense)
+            yield interval
+            elapsed += interval
+
+        yield from super().intervals(rng)
+
+
+# Fixed 2s interval, the schedule all tools used before backoff was added
+FLAT = PollSchedule(initial=2.0, multiplier=1.0, max_interval=2.0, jitter=False)
+
+# Models that usually return within a few seconds (nano-banana, Gemini Flash image)
+FAST_IMAGE = PollSchedule(initial=2.0, multiplier=1.5, max_interval=8.0, fast_polls=3, fast_interval=1.0)
+
+# Image models that take tens of seconds
+IMAGE = PollSchedule(initial=2.0, multiplier=1.5, max_interval=10.0)
+
+# Video models that render for minutes
+VIDEO = PollSchedule(initial=4.0, multiplier=1.6, max_interval=30.0, min_interval=2.0)
+
+# Safety-net polling while a completion webhook is expected
+WEBHOOK_SAFETY_NET = PollSchedule(initial=30.0, multiplier=1.5, max_interval=120.0, min_interval=15.0)
@@ -0,0 +1,210 @@
+"""
+Background poller that multiplexes every in-flight prediction.
+
+Instead of each invocation sleeping in its own polling loop, invocations
+hand their prediction to the process-wide ``PredictionPoller`` and block on
+an event. A small fixed set of worker threads pops whichever prediction is
+due next from a heap, polls it once and either resolves its waiter or
+schedules the next poll, so the number of tracked jobs is not tied to the
+number of threads.
+
+The worker count is configured with ``GPTPROTO_POLLER_WORKERS`` (default 4).
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import requests
+
+from utils import http_pool
+from utils.deadline import Deadline, DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get("GPTPROTO_POLLER_WORKERS", "4"))
+
+
+class PendingPrediction:
+    """
+    One prediction tracked by the poller, and the handle its invocation waits on.
+
+    ``check`` receives the decoded result body and returns ``(done, value)``;
+    it raises to fail the prediction.
+    """
+
+    def __init__(
+        self,
+        result_id: str,
+        url: str,
+        headers: dict[str, str],
+        check: Callable[[dict[str, Any]], tuple[bool, Any]],
+        intervals: Iterator[float],
+        deadline: Deadline,
+        request_timeout: float = 30,
+    ):
+        self.result_id = result_id
+        self.url = url
+        self.headers = headers
+        self.check = check
+        self.intervals = intervals
+        self.deadline = deadline
+        self.request_timeout = request_timeout
+        self.step = f"prediction {result_id} completed"
+        self.polls = 0
+        self.cancelled = False
+        self.result: Any = None
+        self.error: BaseException | None = None
+        # Latest result body seen by a poll or callback, for progress reporting
+        self.last_data: dict[str, Any] | None = None
+        self._done = threading.Event()
+
+    def observe(self, body: dict[str, Any]) -> None:
+        data = body.get("data", body)
+        if isinstance(data, dict):
+            self.last_data = data
+
+    def resolve(self, value: Any) -> None:
+        self.result = value
+        self._done.set()
+
+    def fail(self, error: BaseException) -> None:
+        self.error = error
+        self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait_done(self, timeout: float) -> bool:
+        """
+        Block for up to ``timeout`` seconds; return whether the prediction settled.
+        """
+        return self._done.wait(timeout=timeout)
+
+    def wait(self) -> Any:
+        """
+        Block until the prediction resolves, fails or the deadline passes.
+        """
+        if not self._done.wait(timeout=max(self.deadline.remaining(), 0)):
+            self.cancelled = True
+            raise DeadlineExceededError(f"Deadline of {self.deadline.seconds:g}s exceeded before {self.step}")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class PredictionPoller:
+    """
+    Owns all outstanding predictions and polls them from a fixed worker pool.
+    """
+
+    def __init__(self, workers: int = WORKERS):
+        self.workers = workers
+        self._heap: list[tuple[float, int, PendingPrediction]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"gptproto-poller-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def track(self, pending: PendingPrediction) -> PendingPrediction:
+        """
+        Start tracking a prediction; its first poll follows the first interval.
+        """
+        with self._cond:
+            self._ensure_started()
+        self._schedule(pending, next(pending.intervals))
+        return pending
+
+    def discard(self, pending: PendingPrediction) -> None:
+        """
+        Stop polling a prediction whose invocation no longer waits for it.
+        """
+        pending.cancelled = True
+
+    def in_flight(self) -> int:
+        with self._cond:
+            return sum(1 for _, _, pending in self._heap if not pending.cancelled)
+
+    def _schedule(self, pending: PendingPrediction, delay: float) -> None:
+        # Never sleep past the deadline: the poll at the deadline fails it.
+        delay = max(min(delay, pending.deadline.remaining()), 0)
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), pending))
+            self._cond.notify()
+
+    def _next_due(self) -> PendingPrediction:
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, pending = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+                heapq.heappop(self._heap)
+                return pending
+
+    def _run(self) -> None:
+        while True:
+            pending = self._next_due()
+            if pending.cancelled or pending.done():
+                continue
+            try:
+                self._poll_once(pending)
+            except Exception as e:
+                logger.exception("Unexpected error polling prediction %s", pending.result_id)
+                pending.fail(e)
+
+    def _poll_once(self, pending: PendingPrediction) -> None:
+        pending.polls += 1
+        try:
+            response = http_pool.get(
+                pending.url,
+                headers=pending.headers,
+                timeout=pending.deadline.timeout(pending.request_timeout, step=pending.step),
+            )
+            if response.status_code == 200:
+                body = response.json()
+                pending.observe(body)
+                done, value = pending.check(body)
+                if done:
+                    pending.resolve(value)
+                    return
+        except requests.exceptions.RequestException:
+            # Network error, continue trying
+            pass
+        except Exception as e:
+            pending.fail(e)
+            return
+
+        self._schedule(pending, next(pending.intervals))
+
+
+_poller_lock = threading.Lock()
+_poller: PredictionPoller | None = None
+
+
+def get_poller() -> PredictionPoller:
+    """
+    Return the process-wide poller.
+    """
+    global _poller
+    if _poller is None:
+        with _poller_lock:
+            if _poller is None:
+                _poller = PredictionPoller()
+    return _poller
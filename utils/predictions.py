@@ -0,0 +1,252 @@
+"""
+Shared polling for asynchronous GPTProto prediction tasks (``/api/v3``).
+
+Image and video tools submit a task, get back a prediction ID and then
+wait on ``/predictions/{id}/result`` until it succeeds or fails. Polling
+itself is done by the shared background poller in ``utils.poller``.
+
+A prediction whose invocation stops waiting for it is cancelled on the
+provider so orphaned renders do not hold on to GPU quota and concurrency
+slots. ``GPTPROTO_CANCEL_ON`` lists when that happens: ``abandoned`` (the
+caller closed the tool's generator, e.g. on disconnect), ``deadline`` (the
+invocation's deadline passed) and ``error`` (waiting failed for any reason
+other than the task itself failing). All three are on by default; set it to
+``none`` to always leave tasks running. ``fetch_prediction_result`` never
+cancels, since the task it waits on is one the caller chose to keep.
+"""
+
+import functools
+import logging
+import os
+import time
+from collections.abc import Generator
+from typing import Any
+
+import requests
+
+from utils import http_pool, poll_schedule, task_journal, webhook
+from utils.completion_stats import CompletionStats
+from utils.deadline import Deadline, DeadlineExceededError
+from utils.poll_schedule import PollSchedule
+from utils.poller import PendingPrediction, get_poller
+from utils.progress import ProgressReporter, ProgressUpdate
+from utils.task_journal import TaskJournal
+
+logger = logging.getLogger(__name__)
+
+API_BASE = "https://gptproto.com/api/v3"
+
+CANCEL_ABANDONED = "abandoned"
+CANCEL_DEADLINE = "deadline"
+CANCEL_ERROR = "error"
+CANCEL_ON = frozenset(
+    reason.strip().lower()
+    for reason in os.environ.get("GPTPROTO_CANCEL_ON", "abandoned,deadline,error").split(",")
+    if reason.strip()
+)
+# Cancelling runs after the deadline may already be spent, so it has its own timeout
+CANCEL_TIMEOUT = 5
+
+# How often a waiting invocation wakes up to check for progress to report
+PROGRESS_CHECK_INTERVAL = 1.0
+
+
+class PredictionFailedError(Exception):
+    """
+    The provider reported that the prediction failed or was cancelled.
+    """
+
+
+def extract_output_url(data: dict[str, Any], url_key: str) -> str | None:
+    """
+    Extract the generated asset URL from a completed prediction.
+    """
+    # Try to extract URL from "outputs" array first
+    outputs = data.get("outputs")
+    if isinstance(outputs, list) and len(outputs) > 0:
+        return outputs[0]
+
+    # Fallback to "output" field
+    output = data.get("output")
+    if isinstance(output, list) and len(output) > 0:
+        return output[0]
+    elif isinstance(output, str):
+        return output
+
+    # Try other common fields
+    return data.get(url_key) or data.get("url") or data.get("result")
+
+
+def read_result(result: dict[str, Any], url_key: str) -> tuple[bool, str | None]:
+    """
+    Interpret a ``/predictions/{id}/result`` body.
+
+    Returns ``(True, url)`` once the prediction succeeded and ``(False, None)``
+    while it is still processing; raises if it failed.
+    """
+    # Handle wrapped response: {"data": {...}, "code": 200}
+    data = result.get("data", result)
+
+    # Check if task is completed
+    status = data.get("status", "").lower()
+
+    if status in ("succeeded", "completed", "success"):
+        return True, extract_output_url(data, url_key)
+
+    elif status in ("failed", "error"):
+        error_msg = data.get("error") or result.get("message") or "Unknown error"
+        raise PredictionFailedError(f"Task failed: {error_msg}")
+
+    elif status in ("cancelled", "canceled"):
+        raise PredictionFailedError("Task was cancelled")
+
+    # Still processing, continue polling
+    return False, None
+
+
+def check_result(
+    headers: dict[str, str],
+    result_id: str,
+    url_key: str,
+    deadline: Deadline,
+    request_timeout: float = 30,
+) -> tuple[bool, str | None]:
+    """
+    Fetch a prediction's result once; see ``read_result`` for the return value.
+    """
+    url = f"{API_BASE}/predictions/{result_id}/result"
+    response = http_pool.get(url, headers=headers, timeout=deadline.timeout(request_timeout))
+
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch prediction: HTTP {response.status_code} - {response.text}")
+
+    return read_result(response.json(), url_key)
+
+
+def cancel_prediction(headers: dict[str, str], result_id: str, timeout: float = CANCEL_TIMEOUT) -> bool:
+    """
+    Ask the provider to stop a prediction; return whether it accepted.
+
+    Failures are logged rather than raised, since cancelling is best effort
+    and always happens while another outcome is already being reported.
+    """
+    url = f"{API_BASE}/predictions/{result_id}/cancel"
+    try:
+        response = http_pool.post(url, headers=headers, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Could not cancel prediction %s: %s", result_id, e)
+        return False
+
+    if not 200 <= response.status_code < 300:
+        logger.warning("Could not cancel prediction %s: HTTP %s", result_id, response.status_code)
+        return False
+    return True
+
+
+def _cancel(
+    reason: str,
+    cancel_on: frozenset[str],
+    headers: dict[str, str],
+    result_id: str,
+    journal: TaskJournal | None,
+    error: str | None = None,
+) -> bool:
+    if reason not in cancel_on or not cancel_prediction(headers, result_id):
+        return False
+    if journal is not None:
+        journal.update(result_id, task_journal.CANCELLED, error=error or f"Cancelled ({reason})")
+    return True
+
+
+def poll_result(
+    headers: dict[str, str],
+    result_id: str,
+    deadline: Deadline,
+    url_key: str,
+    schedule: PollSchedule = poll_schedule.IMAGE,
+    request_timeout: float = 30,
+    stats: CompletionStats | None = None,
+    bucket: str = "",
+    journal: TaskJournal | None = None,
+    cancel_on: frozenset[str] = CANCEL_ON,
+) -> Generator[ProgressUpdate, None, str | None]:
+    """
+    Wait for a prediction to complete, fail or run out of deadline.
+
+    The prediction is handed to the shared background poller, which polls
+    it according to ``schedule``. While waiting, this generator yields
+    rate-limited ``ProgressUpdate`` objects; its return value is the result
+    (use ``yield from``, or ``progress.relay`` inside a tool).
+    With ``stats``, the schedule is timed by the completion times observed
+    for ``bucket`` and this prediction's duration is recorded on success.
+    In webhook mode the completion callback resolves the wait and polling
+    drops to a slow safety-net schedule. With ``journal``, the outcome is
+    written to the prediction's journal entry.
+
+    The prediction is cancelled when the generator is closed, the deadline
+    passes or waiting fails, for each reason listed in ``cancel_on``.
+
+    Returns the output URL, or None if the prediction completed without one.
+    Raises ``DeadlineExceededError`` when the budget is used up; unless it
+    was cancelled, the task keeps running and can be collected with
+    ``fetch_prediction_result``.
+    """
+    receiver = webhook.get_receiver()
+    if receiver is not None:
+        schedule = poll_schedule.WEBHOOK_SAFETY_NET
+    elif stats is not None:
+        schedule = stats.schedule_for(bucket, schedule)
+
+    pending = PendingPrediction(
+        result_id=result_id,
+        url=f"{API_BASE}/predictions/{result_id}/result",
+        headers=headers,
+        check=functools.partial(read_result, url_key=url_key),
+        intervals=schedule.intervals(),
+        deadline=deadline,
+        request_timeout=request_timeout,
+    )
+    started = time.monotonic()
+    poller = get_poller()
+    if receiver is not None:
+        receiver.register(result_id, pending)
+    poller.track(pending)
+    reporter = ProgressReporter(result_id)
+    try:
+        while not pending.wait_done(timeout=max(min(PROGRESS_CHECK_INTERVAL, deadline.remaining()), 0)):
+            if deadline.expired():
+                break
+            update = reporter.observe(pending.last_data)
+            if update is not None:
+                yield update
+        output_url = pending.wait()
+    except GeneratorExit:
+        # Nobody is waiting for the output any more
+        _cancel(CANCEL_ABANDONED, cancel_on, headers, result_id, journal)
+        raise
+    except DeadlineExceededError as e:
+        if _cancel(CANCEL_DEADLINE, cancel_on, headers, result_id, journal, error=str(e)):
+            raise DeadlineExceededError(f"{e}. The task was cancelled (ID: {result_id})") from e
+        if journal is not None:
+            journal.update(result_id, task_journal.TIMED_OUT)
+        raise DeadlineExceededError(
+            f"{e}. The task is still running; collect it later with fetch_prediction_result (ID: {result_id})"
+        ) from e
+    except PredictionFailedError as e:
+        if journal is not None:
+            journal.update(result_id, task_journal.FAILED, error=str(e))
+        raise
+    except Exception as e:
+        if not _cancel(CANCEL_ERROR, cancel_on, headers, result_id, journal, error=str(e)) and journal is not None:
+            journal.update(result_id, task_journal.FAILED, error=str(e))
+        raise
+    finally:
+        poller.discard(pending)
+        if receiver is not None:
+            receiver.unregister(result_id)
+
+    if journal is not None:
+        journal.update(result_id, task_journal.SUCCEEDED, output=output_url)
+    if stats is not None:
+        stats.record(bucket, time.monotonic() - started)
+    return output_url
@@ -0,0 +1,46 @@
+"""
+Concurrent fetching of a request's input media.
+
+A Gemini request can carry an image to download and encode plus a file and
+a video URL to probe. Done one after another, the wait before the model
+call is the sum of the three; ``gather`` runs them at the same time so it
+is the slowest of them. Each call bounds its own network timeouts by the
+invocation deadline, and ``gather`` stops waiting once the deadline is
+gone. The first failure is raised as soon as it happens, without waiting
+for the other calls.
+
+A single call (the common image-only request) runs on the calling thread
+with no timeout around it, so it is bounded only by its own deadline
+checks: ``inline_media.fetch`` and ``media_type.probe`` make those
+between reads and on every network timeout.
+"""
+
+from collections.abc import Callable
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any
+
+from utils.deadline import Deadline
+
+
+def gather(calls: dict[str, Callable[[], Any]], deadline: Deadline) -> dict[str, Any]:
+    """
+    Run ``calls`` concurrently and return their results by name.
+
+    A single call runs directly and is bounded only by its own checks.
+    """
+    if len(calls) <= 1:
+        return {name: call() for name, call in calls.items()}
+
+    pool = ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="gptproto-prefetch")
+    try:
+        futures = {name: pool.submit(call) for name, call in calls.items()}
+        done, pending = wait(futures.values(), timeout=deadline.timeout(step="media prefetch"), return_when=FIRST_EXCEPTION)
+        for future in futures.values():
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        if pending:
+            deadline.check("media prefetch finished")
+        return {name: future.result() for name, future in futures.items()}
+    finally:
+        # Calls still running after a failure finish on their own timeouts
+        pool.shutdown(wait=False, cancel_futures=True)
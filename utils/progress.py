@@ -0,0 +1,111 @@
+"""
+Progress reporting while an invocation waits for a prediction.
+
+The waiting loop feeds every observed result body to a ``ProgressReporter``,
+which turns status transitions, queue position, percentage and ETA into
+``ProgressUpdate`` objects. Updates are rate-limited: a status change is
+reported at most every ``MIN_GAP`` seconds and otherwise a heartbeat with the
+elapsed time is sent every ``GPTPROTO_PROGRESS_INTERVAL`` seconds (default 15).
+"""
+
+import os
+import time
+from collections.abc import Generator
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, TypeVar
+
+if TYPE_CHECKING:
+    from dify_plugin import Tool
+    from dify_plugin.entities.tool import ToolInvokeMessage
+
+T = TypeVar("T")
+
+HEARTBEAT_INTERVAL = float(os.environ.get("GPTPROTO_PROGRESS_INTERVAL", "15"))
+MIN_GAP = 2.0
+
+
+@dataclass
+class ProgressUpdate:
+    result_id: str
+    status: str
+    elapsed: float
+    percent: float | None = None
+    queue_position: int | None = None
+    eta: float | None = None
+
+    def text(self) -> str:
+        details = []
+        if self.percent is not None:
+            details.append(f"{self.percent:.0f}%")
+        if self.queue_position is not None:
+            details.append(f"queue position {self.queue_position}")
+        if self.eta is not None:
+            details.append(f"ETA {self.eta:.0f}s")
+        suffix = f" ({', '.join(details)})" if details else ""
+        minutes, seconds = divmod(int(self.elapsed), 60)
+        elapsed = f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+        return f"Status: {self.status}{suffix} - {elapsed} elapsed (ID: {self.result_id})"
+
+
+def _number(data: dict[str, Any], *keys: str) -> float | None:
+    for key in keys:
+        value = data.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    return None
+
+
+class ProgressReporter:
+    """
+    Rate-limited conversion of observed result bodies into progress updates.
+    """
+
+    def __init__(self, result_id: str, interval: float = HEARTBEAT_INTERVAL):
+        self.result_id = result_id
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last_status: str | None = None
+        self._last_emit = float("-inf")
+
+    def observe(self, data: dict[str, Any] | None) -> ProgressUpdate | None:
+        """
+        Return an update if one is due for the latest result body.
+        """
+        now = time.monotonic()
+        data = data or {}
+        status = str(data.get("status") or self._last_status or "submitted").lower()
+        changed = status != self._last_status
+        if not (changed and now - self._last_emit >= MIN_GAP) and now - self._last_emit < self.interval:
+            return None
+
+        percent = _number(data, "progress", "percent", "percentage")
+        if percent is not None and 0 < percent < 1:
+            # Some endpoints report progress as a fraction
+            percent *= 100
+        queue_position = _number(data, "queue_position", "position")
+        self._last_status = status
+        self._last_emit = now
+        return ProgressUpdate(
+            result_id=self.result_id,
+            status=status,
+            elapsed=now - self.started,
+            percent=percent,
+            queue_position=int(queue_position) if queue_position is not None else None,
+            eta=_number(data, "eta", "estimated_time", "eta_seconds"),
+        )
+
+
+def relay(tool: "Tool", updates: Generator[ProgressUpdate, None, T]) -> Generator["ToolInvokeMessage", None, T]:
+    """
+    Yield each progress update as tool messages and return the wait's result.
+
+    Each update becomes a text message and a ``progress`` variable holding
+    the structured fields, so workflow nodes can react to slow jobs.
+    """
+    while True:
+        try:
+            update = next(updates)
+        except StopIteration as stop:
+            return stop.value
+        yield tool.create_text_message(update.text())
+        yield tool.create_variable_message("progress", asdict(update))
@@ -0,0 +1,148 @@
+"""
+Incremental server-sent events parser for streaming text endpoints.
+
+Streaming responses (``stream: true``, ``alt=sse``) arrive as
+``text/event-stream``: events separated by a blank line, each made of
+``event:`` and ``data:`` fields. The four wire formats the text tools read
+(Anthropic messages, OpenAI chat chunks, OpenAI responses events and Gemini
+SSE) all fit this shape.
+
+``SSEParser`` works on the raw byte chunks from ``iter_content``. Chunks are
+appended to one reusable ``bytearray``; all complete events are split off
+at their blank-line boundaries in one pass and the consumed prefix is
+dropped once per chunk, so there is no per-line decoding or string
+concatenation. Events whose name is not wanted are skipped before their
+data is copied, and JSON is only decoded when a consumer calls
+``SSEEvent.json()``.
+"""
+
+import json
+from collections.abc import Collection, Iterable, Iterator
+from typing import Any, NamedTuple
+
+import requests
+
+
+class SSEEvent(NamedTuple):
+    event: str | None
+    data: bytes
+
+    def json(self) -> Any:
+        # Decoding first skips json's pure-Python encoding detection for bytes
+        return json.loads(self.data.decode("utf-8"))
+
+    @property
+    def text(self) -> str:
+        return self.data.decode("utf-8")
+
+
+# Builds an SSEEvent without going through the generated Python __new__
+_new_event = tuple.__new__
+
+
+class SSEParser:
+    """
+    Turns byte chunks into ``SSEEvent`` objects as event boundaries arrive.
+
+    With ``events``, named events outside that set are dropped without
+    copying their data; unnamed events (OpenAI chat, Gemini) are always kept.
+    """
+
+    def __init__(self, events: Collection[str] | None = None):
+        self.events = frozenset(events) if events is not None else None
+        self._buffer = bytearray()
+        # Offset from which to look for the next boundary, so a large event
+        # arriving in many chunks is not rescanned from its start each time
+        self._scan = 0
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        """
+        Add a chunk and return the events it completed.
+        """
+        buffer = self._buffer
+        split_crlf = buffer.endswith(b"\r")
+        buffer += chunk
+        if split_crlf or b"\r" in chunk:
+            # CRLF line endings are rare; normalise them in place and rescan
+            buffer[:] = buffer.replace(b"\r\n", b"\n")
+            self._scan = 0
+
+        cut = buffer.rfind(b"\n\n", self._scan)
+        if cut < 0:
+            self._scan = max(len(buffer) - 1, 0)
+            return []
+
+        # Split every complete event at once, then keep only the partial tail
+        with memoryview(buffer) as view:
+            blocks = view[:cut].tobytes().split(b"\n\n")
+        del buffer[: cut + 2]
+        self._scan = max(len(buffer) - 1, 0)
+
+        events: list[SSEEvent] = []
+        wanted = self.events
+        for block in blocks:
+            # Fast paths: one data line, optionally preceded by an event name,
+            # which is what all four formats send
+            if block.startswith(b"data: ") and b"\n" not in block:
+                events.append(_new_event(SSEEvent, (None, block[6:])))
+                continue
+            if block.startswith(b"event: "):
+                newline = block.find(b"\n")
+                if newline > 0 and block.startswith(b"data: ", newline + 1) and block.find(b"\n", newline + 1) < 0:
+                    name = block[7:newline].decode("utf-8")
+                    if wanted is None or name in wanted:
+                        events.append(_new_event(SSEEvent, (name, block[newline + 7 :])))
+                    continue
+            if block:
+                event = self._parse(block)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def close(self) -> list[SSEEvent]:
+        """
+        Return the last event if the stream ended without a blank line.
+        """
+        block = bytes(self._buffer).strip(b"\n")
+        self._buffer.clear()
+        self._scan = 0
+        event = self._parse(block) if block else None
+        return [event] if event is not None else []
+
+    def _parse(self, block: bytes) -> SSEEvent | None:
+        # General path: comments, id/retry fields and multi-line data
+        name: str | None = None
+        data: list[bytes] = []
+        for line in block.split(b"\n"):
+            field, _, value = line.partition(b":")
+            if value.startswith(b" "):
+                value = value[1:]
+            if field == b"data":
+                data.append(value)
+            elif field == b"event":
+                name = value.decode("utf-8")
+        if not data:
+            return None
+        if name is not None and self.events is not None and name not in self.events:
+            return None
+        return SSEEvent(name, b"\n".join(data))
+
+
+def parse_chunks(chunks: Iterable[bytes], events: Collection[str] | None = None) -> Iterator[SSEEvent]:
+    """
+    Yield the events in a stream of byte chunks as they complete.
+
+    ``events`` limits named events to the ones the caller handles.
+    """
+    parser = SSEParser(events)
+    for chunk in chunks:
+        if chunk:
+            yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def iter_events(response: requests.Response, events: Collection[str] | None = None) -> Iterator[SSEEvent]:
+    """
+    Yield the events of a streamed response as they arrive.
+    """
+    return parse_chunks(response.iter_content(chunk_size=None), events)
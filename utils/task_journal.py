@@ -0,0 +1,146 @@
+"""
+Durable journal of submitted prediction tasks.
+
+Every async tool records its prediction ID, endpoint and prompt in plugin
+storage right after submitting. If an invocation stops waiting (deadline,
+disconnect) and the job was not cancelled, the paid job can still be
+collected later with the ``fetch_prediction_result`` tool instead of being
+submitted again.
+
+Plugin storage is small (1 MiB for this plugin) and cannot list its keys,
+so the journal only keeps what may still be collected:
+
+- an entry is deleted once its task succeeded, failed or was cancelled
+- an index of open entries is pruned on every submit, dropping entries
+  older than ``GPTPROTO_JOURNAL_TTL`` seconds (default 3 days, longer than
+  GPTProto keeps outputs) and all but the newest ``MAX_ENTRIES``
+- only the first ``PROMPT_CHARS`` characters of the prompt are stored, to
+  recognise the task, not every tool parameter
+"""
+
+import json
+import logging
+import os
+import time
+from collections.abc import Mapping
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+TTL = float(os.environ.get("GPTPROTO_JOURNAL_TTL", str(3 * 24 * 3600)))
+MAX_ENTRIES = 200
+PROMPT_CHARS = 200
+INDEX_KEY = "task_journal_index"
+
+SUBMITTED = "submitted"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TIMED_OUT = "timed_out"
+CANCELLED = "cancelled"
+# Nothing is left to collect for these, so their entries are deleted
+FINISHED = frozenset({SUCCEEDED, FAILED, CANCELLED})
+
+
+def _storage_key(result_id: str) -> str:
+    return f"task_journal_{result_id}"
+
+
+class TaskJournal:
+    """
+    Prediction entries keyed by ID, stored as JSON in plugin storage.
+
+    Storage failures are logged and ignored so journaling never fails a
+    generation that otherwise succeeded. Concurrent submits can each miss
+    the other's index update; the entry that drops out is then only removed
+    when its task finishes.
+    """
+
+    def __init__(self, storage: Any):
+        self.storage = storage
+
+    def get(self, result_id: str) -> dict[str, Any] | None:
+        try:
+            key = _storage_key(result_id)
+            if self.storage.exist(key):
+                return json.loads(self.storage.get(key).decode("utf-8"))
+        except Exception as e:
+            logger.debug("Could not read journal entry %s: %s", result_id, e)
+        return None
+
+    def _put(self, entry: dict[str, Any]) -> None:
+        try:
+            payload = json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8")
+            self.storage.set(_storage_key(entry["id"]), payload)
+        except Exception as e:
+            logger.warning("Could not write journal entry %s: %s", entry.get("id"), e)
+
+    def _load_index(self) -> dict[str, float]:
+        try:
+            if self.storage.exist(INDEX_KEY):
+                return json.loads(self.storage.get(INDEX_KEY).decode("utf-8"))
+        except Exception as e:
+            logger.debug("Could not read journal index: %s", e)
+        return {}
+
+    def _save_index(self, index: dict[str, float]) -> None:
+        try:
+            self.storage.set(INDEX_KEY, json.dumps(index).encode("utf-8"))
+        except Exception as e:
+            logger.warning("Could not write journal index: %s", e)
+
+    def _delete(self, result_id: str) -> None:
+        try:
+            self.storage.delete(_storage_key(result_id))
+        except Exception as e:
+            logger.debug("Could not delete journal entry %s: %s", result_id, e)
+
+    def _prune(self, index: dict[str, float], now: float) -> None:
+        expired = [result_id for result_id, submitted_at in index.items() if now - submitted_at > TTL]
+        newest_first = sorted(index, key=index.__getitem__, reverse=True)
+        for result_id in set(expired) | set(newest_first[MAX_ENTRIES:]):
+            self._delete(result_id)
+            del index[result_id]
+
+    def record_submit(
+        self,
+        result_id: str,
+        endpoint: str,
+        url_key: str,
+        parameters: Mapping[str, Any],
+    ) -> None:
+        now = time.time()
+        index = self._load_index()
+        index[result_id] = now
+        self._prune(index, now)
+        self._save_index(index)
+        prompt = parameters.get("prompt")
+        self._put(
+            {
+                "id": result_id,
+                "endpoint": endpoint,
+                "url_key": url_key,
+                "prompt": prompt[:PROMPT_CHARS] if isinstance(prompt, str) else None,
+                "status": SUBMITTED,
+                "output": None,
+                "error": None,
+                "submitted_at": now,
+                "updated_at": now,
+            }
+        )
+
+    def update(self, result_id: str, status: str, output: str | None = None, error: str | None = None) -> None:
+        if status in FINISHED:
+            self.remove(result_id)
+            return
+        entry = self.get(result_id) or {"id": result_id, "submitted_at": None}
+        entry.update(status=status, output=output, error=error, updated_at=time.time())
+        self._put(entry)
+
+    def remove(self, result_id: str) -> None:
+        """
+        Delete the entry of a task that has nothing left to collect.
+        """
+        self._delete(result_id)
+        index = self._load_index()
+        if index.pop(result_id, None) is not None:
+            self._save_index(index)
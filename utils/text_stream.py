@@ -0,0 +1,454 @@
+"""
+Streaming text generation shared by the text tools.
+
+A text tool in streaming mode opens the model's SSE stream, turns its events
+into plain text deltas with the parser for that wire format and hands them
+to ``relay``, which yields them to Dify as they arrive, coalesced into
+fewer messages by ``utils.coalesce``. ``StreamResult``
+collects what the stream reported besides text (stop reason, usage) and the
+timing: time to first token is measured separately from total latency and
+both are reported in a ``latency`` variable when the stream ends.
+
+``stream_text`` opens the stream and guards it against stalls with two
+timeouts instead of one request timeout: a first-byte timeout
+(``GPTPROTO_STREAM_FIRST_BYTE_TIMEOUT``, default 60s) for the response to
+start, and an idle timeout (``GPTPROTO_STREAM_IDLE_TIMEOUT``, default 30s)
+between chunks once it has. A stream that stalls before any text reached
+the user is retried (``GPTPROTO_STREAM_STALL_RETRIES``, default 1); one
+that stalls later fails with ``StreamStalledError`` saying how much text
+was delivered.
+
+An answer cut off by the output token limit can be continued with
+follow-up requests (``utils.continuation``) that are streamed on as one
+answer.
+"""
+
+import logging
+import os
+import time
+from collections.abc import Callable, Collection, Generator, Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+import requests
+import urllib3
+
+from utils import coalesce, continuation, http_pool, inline_media, sse
+from utils.deadline import Deadline
+from utils.sse import SSEEvent
+
+if TYPE_CHECKING:
+    from dify_plugin import Tool
+    from dify_plugin.entities.tool import ToolInvokeMessage
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 10
+FIRST_BYTE_TIMEOUT = float(os.environ.get("GPTPROTO_STREAM_FIRST_BYTE_TIMEOUT", "60"))
+IDLE_TIMEOUT = float(os.environ.get("GPTPROTO_STREAM_IDLE_TIMEOUT", "30"))
+STALL_RETRIES = int(os.environ.get("GPTPROTO_STREAM_STALL_RETRIES", "1"))
+
+# Named events each parser reads; pass to ``sse.iter_events`` so the rest
+# (pings, web search progress, reasoning) are skipped without decoding
+ANTHROPIC_EVENTS = frozenset(
+    {"message_start", "content_block_start", "content_block_delta", "message_delta", "error"}
+)
+OPENAI_RESPONSES_EVENTS = frozenset(
+    {"response.output_text.delta", "response.completed", "response.incomplete", "response.failed", "error"}
+)
+
+
+class StreamStalledError(TimeoutError):
+    """
+    Raised when a stream stops sending data before it completes.
+    """
+
+
+@dataclass
+class StreamResult:
+    started: float = field(default_factory=time.monotonic)
+    first_token_at: float | None = None
+    finished_at: float | None = None
+    stop_reason: str | None = None
+    usage: dict[str, Any] | None = None
+    # Characters already yielded to the user
+    delivered: int = 0
+    # Trailing whitespace ``relay`` has not yielded yet
+    held: str = ""
+
+    @property
+    def time_to_first_token(self) -> float | None:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started
+
+    @property
+    def total(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started
+
+    def latency(self) -> dict[str, Any]:
+        ttft = self.time_to_first_token
+        return {
+            "time_to_first_token": round(ttft, 3) if ttft is not None else None,
+            "total": round(self.total, 3),
+        }
+
+
+def anthropic_deltas(events: Iterable[SSEEvent], result: StreamResult) -> Iterator[str]:
+    """
+    Text deltas from an Anthropic ``/v1/messages`` stream.
+
+    Text blocks are separated by a newline, as in the non-streaming reply;
+    tool blocks such as web search calls and their results are skipped.
+    """
+    text_blocks = 0
+    for event in events:
+        payload = event.json()
+        kind = event.event or payload.get("type")
+        if kind == "content_block_start":
+            if payload.get("content_block", {}).get("type") == "text":
+                if text_blocks:
+                    yield "\n"
+                text_blocks += 1
+        elif kind == "content_block_delta":
+            delta = payload.get("delta", {})
+            if delta.get("type") == "text_delta" and delta.get("text"):
+                yield delta["text"]
+        elif kind == "message_start":
+            result.usage = dict(payload.get("message", {}).get("usage") or {})
+        elif kind == "message_delta":
+            result.stop_reason = payload.get("delta", {}).get("stop_reason") or result.stop_reason
+            if payload.get("usage"):
+                result.usage = {**(result.usage or {}), **payload["usage"]}
+        elif kind == "error":
+            error = payload.get("error", {})
+            raise Exception(f"Stream error: {error.get('message') or error}")
+
+
+def openai_chat_deltas(events: Iterable[SSEEvent], result: StreamResult) -> Iterator[str]:
+    """
+    Text deltas from an OpenAI-compatible ``/chat/completions`` stream.
+
+    Only the first choice is read. Tool call deltas (e.g. web search) carry
+    no text and are skipped; the stream ends at ``data: [DONE]``.
+    """
+    for event in events:
+        if event.data == b"[DONE]":
+            return
+        payload = event.json()
+        if payload.get("error"):
+            error = payload["error"]
+            raise Exception(f"Stream error: {error.get('message') if isinstance(error, dict) else error}")
+        if payload.get("usage"):
+            result.usage = payload["usage"]
+        for choice in payload.get("choices") or []:
+            if choice.get("index", 0) != 0:
+                continue
+            content = (choice.get("delta") or {}).get("content")
+            if isinstance(content, str):
+                yield content
+            elif isinstance(content, list):
+                # Some upstreams send Anthropic-style content blocks
+                for block in content:
+                    if isinstance(block, dict) and block.get("type") == "text":
+                        yield block.get("text", "")
+            if choice.get("finish_reason"):
+                result.stop_reason = choice["finish_reason"]
+
+
+def gemini_deltas(events: Iterable[SSEEvent], result: StreamResult) -> Iterator[str]:
+    """
+    Text deltas from a Gemini ``:streamGenerateContent?alt=sse`` stream.
+
+    Every text part of the first candidate is yielded as it arrives, in
+    order; thought summaries are skipped. Further candidates (when more
+    than one is requested) are collected and yielded after it, each under
+    its own heading.
+    """
+    others: dict[int, list[str]] = {}
+    for event in events:
+        payload = event.json()
+        if payload.get("error"):
+            error = payload["error"]
+            raise Exception(f"Stream error: {error.get('message') if isinstance(error, dict) else error}")
+        block_reason = (payload.get("promptFeedback") or {}).get("blockReason")
+        if block_reason:
+            raise Exception(f"Prompt blocked: {block_reason}")
+        if payload.get("usageMetadata"):
+            result.usage = payload["usageMetadata"]
+        for candidate in payload.get("candidates") or []:
+            index = candidate.get("index", 0)
+            texts = [
+                part["text"]
+                for part in (candidate.get("content") or {}).get("parts") or []
+                if part.get("text") and not part.get("thought")
+            ]
+            if index == 0:
+                yield from texts
+                if candidate.get("finishReason"):
+                    result.stop_reason = candidate["finishReason"]
+            else:
+                others.setdefault(index, []).extend(texts)
+
+    for index in sorted(others):
+        yield f"\n\n[Candidate {index + 1}]\n"
+        yield from others[index]
+
+
+def openai_responses_deltas(events: Iterable[SSEEvent], result: StreamResult) -> Iterator[str]:
+    """
+    Text deltas from an OpenAI ``/responses`` stream.
+
+    ``response.output_text.delta`` events are yielded as they arrive, with a
+    newline between separate output texts; reasoning and web search events
+    carry no answer text and are skipped. Usage and status come from the
+    final ``response.completed`` (or ``response.incomplete``) event.
+    """
+    current: tuple[int, int] | None = None
+    for event in events:
+        payload = event.json()
+        kind = event.event or payload.get("type")
+        if kind == "response.output_text.delta":
+            part = (payload.get("output_index", 0), payload.get("content_index", 0))
+            if current is not None and part != current:
+                yield "\n"
+            current = part
+            yield payload.get("delta", "")
+        elif kind in ("response.completed", "response.incomplete"):
+            response = payload.get("response") or {}
+            result.usage = response.get("usage") or result.usage
+            reason = (response.get("incomplete_details") or {}).get("reason")
+            result.stop_reason = reason or response.get("status")
+        elif kind == "response.failed":
+            error = (payload.get("response") or {}).get("error") or {}
+            raise Exception(f"Stream error: {error.get('message') or error or 'response failed'}")
+        elif kind == "error":
+            raise Exception(f"Stream error: {payload.get('message') or payload}")
+
+
+def _checked(deltas: Iterable[str], deadline: Deadline) -> Iterator[str]:
+    for delta in deltas:
+        deadline.check("stream completed")
+        yield delta
+
+
+def relay(
+    tool: "Tool",
+    deltas: Iterable[str],
+    result: StreamResult,
+    deadline: Deadline,
+    hold_whitespace: bool = False,
+) -> Generator["ToolInvokeMessage", None, str]:
+    """
+    Yield the text deltas as text messages and return the text.
+
+    Deltas are coalesced into larger chunks (see ``utils.coalesce``) and the
+    deadline is checked between deltas. With ``hold_whitespace``, trailing
+    whitespace is yielded only once more text follows; what is left at the
+    end is in ``result.held`` for the caller to yield or drop. The returned
+    text includes it.
+    """
+    parts: list[str] = []
+    for chunk in coalesce.coalesce(_checked(deltas, deadline)):
+        if result.first_token_at is None:
+            result.first_token_at = time.monotonic()
+        parts.append(chunk)
+        if hold_whitespace:
+            chunk = result.held + chunk
+            result.held = chunk[len(chunk.rstrip()):]
+            chunk = chunk[: len(chunk) - len(result.held)]
+            if not chunk:
+                continue
+        result.delivered += len(chunk)
+        yield tool.create_text_message(chunk)
+    return "".join(parts)
+
+
+def _is_read_timeout(error: requests.exceptions.ConnectionError) -> bool:
+    # iter_content wraps a mid-body read timeout in a ConnectionError
+    return any(isinstance(arg, urllib3.exceptions.ReadTimeoutError) for arg in error.args)
+
+
+def _read_chunks(
+    response: requests.Response,
+    first_byte_timeout: float,
+    idle_timeout: float,
+    deadline: Deadline,
+) -> Iterator[bytes]:
+    """
+    Yield body chunks, raising ``StreamStalledError`` when none arrives in time.
+
+    The first chunk is bounded by the request's read timeout (the first-byte
+    timeout). After each chunk the socket timeout is re-armed to the idle
+    timeout, capped at the remaining deadline.
+    """
+    connection = getattr(response.raw, "connection", None)
+    sock = getattr(connection, "sock", None)
+    limit = first_byte_timeout
+    chunks = response.iter_content(chunk_size=None)
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        except requests.exceptions.ConnectionError as e:
+            if not _is_read_timeout(e):
+                raise
+            deadline.check("stream completed")
+            raise StreamStalledError(f"Stream stalled: no data for {limit:g}s") from e
+        yield chunk
+        if sock is not None:
+            limit = idle_timeout
+            sock.settimeout(max(min(idle_timeout, deadline.remaining()), 0.01))
+
+
+def _add_usage(total: dict[str, Any] | None, usage: dict[str, Any] | None) -> dict[str, Any] | None:
+    # Token counts of continuation requests add up; other fields keep the latest value
+    if not usage:
+        return total
+    merged = dict(total or {})
+    for key, value in usage.items():
+        if isinstance(value, (int, float)) and isinstance(merged.get(key), (int, float)):
+            merged[key] += value
+        else:
+            merged[key] = value
+    return merged
+
+
+def _stream_segment(
+    tool: "Tool",
+    url: str,
+    headers: dict[str, str],
+    data: dict[str, Any],
+    parse: Callable[[Iterable[SSEEvent], StreamResult], Iterator[str]],
+    deadline: Deadline,
+    events: Collection[str] | None,
+    params: dict[str, str] | None,
+    first_byte_timeout: float,
+    idle_timeout: float,
+    answer: StreamResult,
+    hold_whitespace: bool,
+) -> Generator["ToolInvokeMessage", None, tuple[str, StreamResult]]:
+    """
+    Stream one request, retrying stalls while it has delivered no text.
+    """
+    attempt = 0
+    while True:
+        result = StreamResult(started=answer.started)
+        try:
+            try:
+                response = http_pool.post(
+                    url,
+                    headers=headers,
+                    params=params,
+                    timeout=(deadline.timeout(CONNECT_TIMEOUT), deadline.timeout(first_byte_timeout)),
+                    stream=True,
+                    **inline_media.body_kwargs(data),
+                )
+            except requests.exceptions.ReadTimeout as e:
+                deadline.check("stream started")
+                raise StreamStalledError(f"Stream stalled: no response for {first_byte_timeout:g}s") from e
+
+            with response:
+                if response.status_code != 200:
+                    raise Exception(f"API request failed: HTTP {response.status_code} - {response.text}")
+
+                chunks = _read_chunks(response, first_byte_timeout, idle_timeout, deadline)
+                deltas = parse(sse.parse_chunks(chunks, events), result)
+                text = yield from relay(tool, deltas, result, deadline, hold_whitespace)
+                return text, result
+
+        except StreamStalledError as e:
+            if result.delivered:
+                delivered = answer.delivered + result.delivered
+                raise StreamStalledError(
+                    f"{e} after {delivered} characters were delivered; the output above is incomplete"
+                ) from e
+            if attempt >= STALL_RETRIES or deadline.expired():
+                raise
+            attempt += 1
+            logger.warning("%s before any output; retrying (attempt %d)", e, attempt + 1)
+
+
+def stream_text(
+    tool: "Tool",
+    url: str,
+    headers: dict[str, str],
+    data: dict[str, Any],
+    parse: Callable[[Iterable[SSEEvent], StreamResult], Iterator[str]],
+    deadline: Deadline,
+    events: Collection[str] | None = None,
+    params: dict[str, str] | None = None,
+    first_byte_timeout: float = FIRST_BYTE_TIMEOUT,
+    idle_timeout: float = IDLE_TIMEOUT,
+    continue_with: continuation.Builder | None = None,
+) -> Generator["ToolInvokeMessage", None, str]:
+    """
+    POST a streaming request and relay its text; return the full text.
+
+    ``parse`` is the wire format's delta parser and ``events`` the named
+    events it reads. Stalls are retried only while no text has been
+    delivered, so the user never sees a repeated prefix.
+
+    With ``continue_with``, an answer cut off by the output token limit is
+    continued: ``continue_with(data, text so far)`` builds the next request
+    (see ``utils.continuation``) and its text is streamed on as part of the
+    same answer. Trailing whitespace of each part is held back until it is
+    known whether the continuation starts with its own, so it is not shown
+    twice. The answer ends with a ``latency`` variable
+    (time to first token and total latency in seconds) and, when reported,
+    a ``usage`` variable summed over all requests.
+    """
+    # Latency is measured from the first attempt, so retries show in it
+    answer = StreamResult()
+    text = ""
+    body = data
+    for continued in range(continuation.MAX_CONTINUATIONS + 1):
+        more, result = yield from _stream_segment(
+            tool,
+            url,
+            headers,
+            body,
+            parse,
+            deadline,
+            events,
+            params,
+            first_byte_timeout,
+            idle_timeout,
+            answer,
+            hold_whitespace=continue_with is not None,
+        )
+        text += more
+        if answer.first_token_at is None:
+            answer.first_token_at = result.first_token_at
+        answer.delivered += result.delivered
+        answer.stop_reason = result.stop_reason
+        answer.usage = _add_usage(answer.usage, result.usage)
+
+        if continue_with is None or not more or not continuation.is_truncated(result.stop_reason):
+            yield from _flush_held(tool, result, answer)
+            break
+        if continued == continuation.MAX_CONTINUATIONS:
+            logger.warning("Output still truncated after %d continuations", continuation.MAX_CONTINUATIONS)
+            yield from _flush_held(tool, result, answer)
+            break
+        logger.info("Output hit the token limit; continuing (%d/%d)", continued + 1, continuation.MAX_CONTINUATIONS)
+        text = continuation.joined(continue_with, text)
+        if text.endswith(result.held):
+            # Kept by the builder, so it belongs to the answer
+            yield from _flush_held(tool, result, answer)
+        body = continue_with(data, text)
+
+    answer.finished_at = time.monotonic()
+    latency = answer.latency()
+    logger.info("Stream finished: first token after %ss, total %ss", latency["time_to_first_token"], latency["total"])
+    yield tool.create_variable_message("latency", latency)
+    if answer.usage:
+        yield tool.create_variable_message("usage", answer.usage)
+    return text
+
+
+def _flush_held(tool: "Tool", result: StreamResult, answer: StreamResult) -> Generator["ToolInvokeMessage", None, None]:
+    if result.held:
+        answer.delivered += len(result.held)
+        yield tool.create_text_message(result.held)
@@ -0,0 +1,207 @@
+"""
+Webhook completion mode for prediction tasks.
+
+When ``GPTPROTO_WEBHOOK_URL`` is set, submits pass a callback URL in the
+``webhook`` query parameter and a small embedded HTTP server receives the
+completion callback. The callback resolves the waiting invocation directly;
+the background poller keeps polling on a slow schedule as a safety net.
+
+Configuration:
+
+- ``GPTPROTO_WEBHOOK_URL``: public base URL that reaches the receiver,
+  e.g. ``https://worker.example.com:8765`` (unset disables webhook mode)
+- ``GPTPROTO_WEBHOOK_HOST``: address the receiver binds to (default ``0.0.0.0``)
+- ``GPTPROTO_WEBHOOK_PORT``: port the receiver listens on (default 8765)
+- ``GPTPROTO_WEBHOOK_SECRET``: path secret that callbacks must carry
+  (default: random per process)
+"""
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from utils.poller import PendingPrediction
+
+logger = logging.getLogger(__name__)
+
+# Callbacks that arrive before their prediction is registered are kept this long
+EARLY_CALLBACK_TTL = 600
+
+
+class WebhookReceiver:
+    """
+    Embedded HTTP server that resolves pending predictions from callbacks.
+
+    Callbacks are accepted on ``POST /webhook/<secret>`` and matched to a
+    pending prediction by the ``id`` in the body.
+    """
+
+    def __init__(self, host: str, port: int, secret: str):
+        self.secret = secret
+        self._lock = threading.Lock()
+        self._pending: dict[str, PendingPrediction] = {}
+        self._early: dict[str, tuple[float, dict[str, Any]]] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def path(self) -> str:
+        return f"/webhook/{self.secret}"
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="gptproto-webhook", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def register(self, result_id: str, pending: PendingPrediction) -> None:
+        with self._lock:
+            early = self._early.pop(result_id, None)
+            self._pending[result_id] = pending
+        if early is not None:
+            self._resolve(pending, early[1])
+
+    def unregister(self, result_id: str) -> None:
+        with self._lock:
+            self._pending.pop(result_id, None)
+
+    def deliver(self, payload: dict[str, Any]) -> bool:
+        """
+        Route one callback body; returns False if it carries no prediction ID.
+        """
+        data = payload.get("data", payload)
+        result_id = data.get("id") if isinstance(data, dict) else None
+        if not result_id:
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(result_id)
+            if pending is None:
+                self._early = {k: v for k, v in self._early.items() if now - v[0] < EARLY_CALLBACK_TTL}
+                self._early[result_id] = (now, payload)
+        if pending is not None:
+            self._resolve(pending, payload)
+        return True
+
+    def _resolve(self, pending: PendingPrediction, payload: dict[str, Any]) -> None:
+        if pending.done():
+            return
+        pending.observe(payload)
+        try:
+            done, value = pending.check(payload)
+        except Exception as e:
+            pending.fail(e)
+            return
+        if done:
+            pending.resolve(value)
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        receiver = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                if self.path.split("?", 1)[0] != receiver.path:
+                    self.send_error(404)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", "0"))
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except (ValueError, json.JSONDecodeError):
+                    self.send_error(400)
+                    return
+                if not isinstance(payload, dict) or not receiver.deliver(payload):
+                    self.send_error(400)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format: str, *args: Any) -> None:
+                logger.debug("webhook: " + format, *args)
+
+        return _Handler
+
+
+_lock = threading.Lock()
+_receiver: WebhookReceiver | None = None
+_public_url = ""
+
+
+def configure(
+    public_url: str | None,
+    host: str = "0.0.0.0",
+    port: int = 8765,
+    secret: str | None = None,
+) -> WebhookReceiver:
+    """
+    Start the receiver and enable webhook mode.
+
+    Called automatically from the environment; scripts and local stand-ins
+    can call it directly (``port=0`` picks a free port, and a ``public_url``
+    of None uses the bound address).
+    """
+    global _receiver, _public_url
+    with _lock:
+        if _receiver is not None:
+            _receiver.stop()
+        _receiver = WebhookReceiver(host, port, secret or secrets.token_urlsafe(16))
+        _receiver.start()
+        _public_url = (public_url or f"http://{host}:{_receiver.port}").rstrip("/")
+        return _receiver
+
+
+def disable() -> None:
+    global _receiver, _public_url
+    with _lock:
+        if _receiver is not None:
+            _receiver.stop()
+        _receiver = None
+        _public_url = ""
+
+
+def get_receiver() -> WebhookReceiver | None:
+    """
+    Return the running receiver, or None when webhook mode is off.
+    """
+    return _receiver
+
+
+def callback_url() -> str | None:
+    receiver = _receiver
+    if receiver is None:
+        return None
+    return f"{_public_url}{receiver.path}"
+
+
+def submit_params() -> dict[str, str]:
+    """
+    Query parameters to add to a task submit; empty when webhook mode is off.
+    """
+    url = callback_url()
+    return {"webhook": url} if url else {}
+
+
+if os.environ.get("GPTPROTO_WEBHOOK_URL"):
+    try:
+        configure(
+            os.environ["GPTPROTO_WEBHOOK_URL"],
+            host=os.environ.get("GPTPROTO_WEBHOOK_HOST", "0.0.0.0"),
+            port=int(os.environ.get("GPTPROTO_WEBHOOK_PORT", "8765")),
+            secret=os.environ.get("GPTPROTO_WEBHOOK_SECRET"),
+        )
+    except OSError as e:
+        logger.warning("Could not start webhook receiver, falling back to polling: %s", e)